@@ -0,0 +1,195 @@
+"""Kontrola przyjmowania żądań wspólna dla app.py i app_sqlite.py.
+
+- limit żądań na klienta (adres IP): token bucket osobno dla odczytów i zapisów,
+  po przekroczeniu od razu 429 z Retry-After,
+- globalny limit równoległych zapisów (POST/PUT/DELETE) z krótką kolejką
+  oczekujących; gdy kolejka jest pełna albo czekanie trwa za długo - 503
+  z Retry-After, zamiast odkładać żądanie za resztą pracy serwera.
+
+Klient z szablonu HTML wstrzymuje się wtedy na czas z Retry-After.
+Endpointy administracyjne sprawdzają dodatkowo token (admin_denied), a dziennik
+replikacji (pełny zrzut notatek) jest dostępny tylko z tokenem albo z adresów
+replik z KEEP_REPLICATION_FOLLOWERS (replication_denied) - i tylko wtedy bez
+limitu na klienta.
+
+Za reverse proxy (np. Render) request.remote_addr to adres proxy, wspólny dla
+wszystkich - KEEP_TRUSTED_PROXIES=<liczba proxy przed aplikacją> włącza
+ProxyFix, który bierze adres klienta z X-Forwarded-For. Bez proxy zmienna
+musi zostać pusta: inaczej klient sam podaje adres i omija limit.
+"""
+import hmac
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, jsonify, request
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+ADMISSION_CONTROL = True
+
+# Token bucket: ile żądań na sekundę w średniej i jak duży chwilowy zryw
+READ_RATE = 20.0
+READ_BURST = 40
+WRITE_RATE = 5.0  # autozapis to jedno żądanie co 2 s, odtwarzanie kolejki offline - seria
+WRITE_BURST = 30
+MAX_CLIENTS = 10000  # ile klientów pamiętać (najdawniej widziani są zapominani)
+# Ile zaufanych proxy dopisuje X-Forwarded-For przed aplikacją (0 - połączenie bezpośrednie)
+TRUSTED_PROXIES = int(os.environ.get('KEEP_TRUSTED_PROXIES', 0))
+
+MAX_CONCURRENT_WRITES = 4  # zapisy wykonywane równocześnie
+WRITE_QUEUE_SIZE = 16  # ile zapisów może czekać na wolne miejsce
+WRITE_QUEUE_TIMEOUT = 2.0  # sekundy czekania w kolejce, potem 503
+BUSY_RETRY_AFTER = 1  # Retry-After (sekundy) dla 503
+
+ADMIN_TOKEN = os.environ.get('KEEP_ADMIN_TOKEN')  # jeśli ustawiony, wymagany w X-Admin-Token
+
+# Adresy replik (po przecinku) z dostępem do dziennika replikacji bez tokenu
+REPLICATION_FOLLOWERS = frozenset(
+    address.strip() for address in os.environ.get('KEEP_REPLICATION_FOLLOWERS', '').split(',') if address.strip()
+)
+
+# Ścieżki bez limitu na klienta dla uprawnionych replik - replika odpytuje dziennik w pętli
+EXEMPT_PREFIXES = ('/api/replication/changes', '/api/replication/snapshot')
+
+_buckets = OrderedDict()  # (klient, 'read'/'write') -> [tokeny, time.monotonic() ostatniego uzupełnienia]
+_admission_lock = threading.Lock()
+_write_slots = threading.Semaphore(MAX_CONCURRENT_WRITES)
+_write_waiting = 0
+_write_active = 0
+_admission_stats = {
+    'rate_limited': 0,
+    'busy_rejected': 0,
+    'queued': 0,
+    'max_wait_ms': 0.0,
+}
+
+
+def take_token(client, kind):
+    """Pobiera żeton z kubełka klienta; zwraca 0 albo liczbę sekund do kolejnego żetonu"""
+    rate, burst = (WRITE_RATE, WRITE_BURST) if kind == 'write' else (READ_RATE, READ_BURST)
+    key = (client, kind)
+    now = time.monotonic()
+    with _admission_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = _buckets[key] = [float(burst), now]
+            while len(_buckets) > MAX_CLIENTS:
+                _buckets.popitem(last=False)
+        else:
+            _buckets.move_to_end(key)
+            bucket[0] = min(float(burst), bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1.0:
+            bucket[0] -= 1.0
+            return 0
+        return (1.0 - bucket[0]) / rate
+
+
+def acquire_write_slot():
+    """Czeka na miejsce dla zapisu (najwyżej WRITE_QUEUE_TIMEOUT); False - serwer zajęty"""
+    global _write_waiting, _write_active
+    if not _write_slots.acquire(blocking=False):
+        with _admission_lock:
+            if _write_waiting >= WRITE_QUEUE_SIZE:
+                return False
+            _write_waiting += 1
+            _admission_stats['queued'] += 1
+
+        started = time.monotonic()
+        acquired = _write_slots.acquire(timeout=WRITE_QUEUE_TIMEOUT)
+        waited_ms = (time.monotonic() - started) * 1000
+
+        with _admission_lock:
+            _write_waiting -= 1
+            _admission_stats['max_wait_ms'] = max(_admission_stats['max_wait_ms'], waited_ms)
+        if not acquired:
+            return False
+
+    with _admission_lock:
+        _write_active += 1
+    return True
+
+
+def release_write_slot():
+    global _write_active
+    with _admission_lock:
+        _write_active -= 1
+    _write_slots.release()
+
+
+def _reject(message, code, retry_after):
+    response = jsonify({'error': message})
+    response.status_code = code
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def admit_request():
+    """before_request: limit na klienta, a dla zapisów - miejsce w puli zapisów"""
+    if not ADMISSION_CONTROL or not request.path.startswith('/api/') or request.method == 'OPTIONS':
+        return None
+
+    write = request.method in ('POST', 'PUT', 'DELETE')
+    if not (request.path.startswith(EXEMPT_PREFIXES) and replication_authorized()):
+        wait = take_token(request.remote_addr or '', 'write' if write else 'read')
+        if wait:
+            _admission_stats['rate_limited'] += 1
+            return _reject('Zbyt wiele żądań - spróbuj ponownie później', 429, wait)
+
+    if write:
+        if not acquire_write_slot():
+            _admission_stats['busy_rejected'] += 1
+            return _reject('Serwer przeciążony - spróbuj ponownie później', 503, BUSY_RETRY_AFTER)
+        g.write_slot = True
+    return None
+
+
+def release_request(exc=None):
+    """teardown_request: zwalnia miejsce zapisu zajęte w admit_request"""
+    if g.pop('write_slot', False):
+        release_write_slot()
+
+
+def admin_denied():
+    """Odpowiedź 403, jeśli ustawiono KEEP_ADMIN_TOKEN, a żądanie go nie zawiera"""
+    if ADMIN_TOKEN and not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+        return jsonify({'error': 'Brak uprawnień'}), 403
+    return None
+
+
+def replication_authorized():
+    """Czy żądanie może czytać dziennik replikacji: adres z KEEP_REPLICATION_FOLLOWERS albo poprawny X-Admin-Token"""
+    if request.remote_addr in REPLICATION_FOLLOWERS:
+        return True
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN)
+
+
+def replication_denied():
+    """Odpowiedź 403 dla żądania dziennika replikacji bez uprawnień (bez konfiguracji - zawsze)"""
+    if not replication_authorized():
+        return jsonify({'error': 'Brak uprawnień do replikacji - ustaw KEEP_ADMIN_TOKEN '
+                                 'albo KEEP_REPLICATION_FOLLOWERS'}), 403
+    return None
+
+
+def install_admission_control(app):
+    """Rejestruje kontrolę przyjmowania żądań - wywołać przed innymi before_request"""
+    if TRUSTED_PROXIES:
+        # Adres klienta z X-Forwarded-For - kubełki liczone na użytkownika, nie na proxy
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
+    app.before_request(admit_request)
+    app.teardown_request(release_request)
+
+
+def admission_stats():
+    with _admission_lock:
+        return {
+            'enabled': ADMISSION_CONTROL,
+            'writes_active': _write_active,
+            'writes_waiting': _write_waiting,
+            'buckets': len(_buckets),
+            **_admission_stats,
+        }
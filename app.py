@@ -1,13 +1,128 @@
-from flask import Flask, render_template_string, request, jsonify
+from flask import Flask, Response, render_template_string, request, jsonify
 from flask_cors import CORS
+import io
 import json
+import mmap
 import os
+import re
+import sqlite3
+import sys
+import time
+import uuid
+import atexit
+import signal
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from itertools import chain, islice
 from datetime import datetime
 
+from admission import admin_denied, admission_stats, install_admission_control
+from archive import (ARCHIVE, ARCHIVE_BATCH, ARCHIVE_AFTER, ARCHIVE_INTERVAL, archive_stats, get_archived, hot_note,
+                     is_stale, iter_archived, list_archived, max_archived_id, record_archive_pass, record_restore,
+                     remove_archived, store_archived, suggest_archived)
+from replication import (CHANGELOG_KEEP, REPLICA_OF, REPLICATION_BATCH, REPLICATION_POLL_INTERVAL,
+                         fetch_from_primary, reject_writes_on_replica, replication_stats)
+from response_cache import cache_stats, cached_list_response, invalidate_lists
+from models import (Note, PREVIEW_LENGTH, Revision, REVISION_KEYFRAME_INTERVAL, pack_text, parse_list_query,
+                    parse_suggest_query, read_ndjson, revision_chain, revision_content, suggest_key, text_value)
+
 app = Flask(__name__)
 CORS(app)
-
-NOTES_FILE = 'notes.json'
+install_admission_control(app)
+
+NOTES_FILE = os.environ.get('KEEP_NOTES_FILE', 'notes.json')
+PORT = int(os.environ.get('KEEP_PORT', 5000))
+
+# Tryb write-behind: handler zmienia tylko stan w pamięci i od razu odpowiada,
+# a zapis notes.json wykonuje osobny wątek w tle
+WRITE_BEHIND = True
+FLUSH_INTERVAL = 1.0  # minimalny odstęp między zapisami na dysk (sekundy)
+
+# Magazyn z plikiem danych mapowanym w pamięci: indeks (notes.idx.json) trzyma
+# metadane i początek treści, a pełne treści leżą w pliku danych
+# notes.<generacja>.dat, czytanym przez mmap dopiero przy otwarciu notatki.
+# Start nie parsuje treści, a w pamięci są tylko faktycznie czytane strony.
+# Przy pierwszym uruchomieniu notes.json jest przenoszony do tego formatu
+MMAP_STORE = True
+NOTES_INDEX_FILE = os.path.splitext(NOTES_FILE)[0] + '.idx.json'
+COMPACT_MIN_BYTES = 1 << 20  # mniejszego pliku danych nie kompaktujemy
+COMPACT_GARBAGE_RATIO = 0.5  # kompaktowanie, gdy nieaktualne treści to ponad połowa pliku
+
+EXPORT_CHUNK_SIZE = 500  # notatek w jednym fragmencie odpowiedzi /api/export
+
+# Historia wersji: przy każdej zmianie poprzedni stan notatki trafia do historii
+# jako delta względem poprzedniej wersji, co kilka wersji w całości. Zmiany
+# historii są dopisywane do dziennika (NDJSON) przez ten sam wątek zapisu w tle,
+# a dziennik jest co jakiś czas scalany z pełnym plikiem historii
+REVISIONS_FILE = os.path.splitext(NOTES_FILE)[0] + '.revisions.json'
+REVISIONS_LOG_FILE = os.path.splitext(NOTES_FILE)[0] + '.revisions.log'
+REVISIONS_LOG_COMPACT = 16 << 20  # bajtów - większy dziennik (i większy od pliku historii) jest scalany
+REVISION_MIN_INTERVAL = 30  # sekundy - kolejne autozapisy w tym oknie nie tworzą nowych wersji
+REVISIONS_KEEP = 50  # ile najnowszych wersji zachować dla notatki
+REVISIONS_MAX_AGE = 30 * 24 * 3600  # starsze wersje są usuwane przy kolejnej zmianie notatki
+
+# Migawki (snapshoty) notes.json - harmonogram w tle i ręcznie przez POST /api/admin/backup.
+# Notatki w pamięci nie są zmieniane w miejscu (copy-on-write), więc spójna
+# migawka to tylko płytka kopia listy, a zapis odbywa się już bez blokady
+BACKUP_DIR = 'backups'
+BACKUP_INTERVAL = 3600  # co ile sekund robić migawkę w tle (0 - wyłączone)
+BACKUP_KEEP = 24  # ile najnowszych migawek zachować
+
+_notes = None
+_notes_lock = threading.RLock()
+_note_index = None  # posortowane indeksy notatek (patrz get_note_index), pod _notes_lock
+_store_generation = 0  # numer bieżącego pliku danych
+_data_map = None  # mmap bieżącego pliku danych
+_data_size = 0
+_appended = {}  # id -> (notatka, offset, długość) treści dopisanych w tej sesji - tylko wątek zapisu
+_store_stats = {
+    'notes_loaded': 0,
+    'load_ms': 0.0,
+    'data_bytes': 0,
+    'live_bytes': 0,
+    'compactions': 0,
+}
+_superseded_file = None  # plik w poprzednim formacie - po pierwszym udanym zapisie dostaje przyrostek .migrated
+_revisions = None  # id notatki -> lista wersji (Revision) rosnąco, pod _notes_lock
+_revision_log = []  # (id notatki, operacja, wersja) czekające na dopisanie do dziennika, pod _notes_lock
+_dirty_since = None  # time.monotonic() pierwszej niezapisanej zmiany
+_flush_lock = threading.Lock()
+_flusher_start_lock = threading.Lock()
+_flush_wakeup = threading.Event()
+_flusher_thread = None
+_flush_stats = {
+    'flushes': 0,
+    'errors': 0,
+    'last_flush_at': None,
+    'last_flush_duration_ms': 0.0,
+    'last_flush_lag_ms': 0.0,
+}
+_epoch = uuid.uuid4().hex  # dziennik jest tylko w pamięci - po restarcie nowa epoka
+_changes = deque(maxlen=CHANGELOG_KEEP)  # (seq, op, id, created) - bez treści, notatka z magazynu przy odczycie
+_change_seq = 0
+_replica_epoch = ''
+_replica_seq = 0
+_replication_thread = None
+_replication_stats = {
+    'applied_seq': 0,
+    'primary_seq': 0,
+    'resyncs': 0,
+    'errors': 0,
+    'last_error': None,
+    'last_sync_at': None,
+    'caught_up_at': None,
+}
+_backup_lock = threading.Lock()  # jedna migawka naraz
+_backup_thread = None
+_backup_stats = {
+    'backups': 0,
+    'errors': 0,
+    'last_backup_at': None,
+    'last_backup_duration_ms': 0.0,
+}
+_archiver_thread = None
+_last_id = None  # największe nadane id (magazyn i archiwum) - licznik dla nowych notatek, pod _notes_lock
 
 
 def load_notes():
@@ -20,12 +135,937 @@ def load_notes():
     return []
 
 
-def save_notes(notes):
+def save_notes(notes, path=None):
+    """Zapisuje notatki atomowo (plik tymczasowy + rename)"""
+    path = path or NOTES_FILE
+    tmp_file = path + '.tmp'
+    try:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump([note.to_json() for note in notes], f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, path)
+        return True
+    except Exception as e:
+        print(f"Błąd zapisu: {e}")
+        return False
+
+
+class MappedBody:
+    """Treść notatki w pliku danych (z prefiksem kodeka jak content_z) - czytana z mmap dopiero przy potrzebie.
+
+    loc = (mmap, offset, długość); kompaktowanie pliku podmienia całą krotkę naraz
+    """
+    __slots__ = ('loc',)
+
+    def __init__(self, data_map, offset, length):
+        self.loc = (data_map, offset, length)
+
+    def __bytes__(self):
+        data_map, offset, length = self.loc
+        return data_map[offset:offset + length]
+
+
+def data_path(generation):
+    return f'{os.path.splitext(NOTES_FILE)[0]}.{generation}.dat'
+
+
+def load_store():
+    """Wczytuje indeks i mapuje plik danych (treści nie są czytane); None, jeśli magazynu jeszcze nie ma"""
+    global _store_generation, _data_map, _data_size
+    if not os.path.exists(NOTES_INDEX_FILE):
+        return None
+
+    started = time.monotonic()
+    with open(NOTES_INDEX_FILE, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    generation = index['generation']
+    path = data_path(generation)
+
+    data_map = None
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path, 'rb') as f:
+            data_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    notes = []
+    live = 0
+    for note_id, title, color, timestamp, head, offset, length in index['notes']:
+        if offset < 0:
+            # Krótka treść w całości w indeksie
+            notes.append(Note(note_id, title, head, color, timestamp))
+        else:
+            notes.append(Note(note_id, title, '', color, timestamp, MappedBody(data_map, offset, length), head))
+            live += length
+
+    _store_generation = generation
+    _data_map = data_map
+    _data_size = len(data_map) if data_map is not None else 0
+    _store_stats['notes_loaded'] = len(notes)
+    _store_stats['load_ms'] = (time.monotonic() - started) * 1000
+    _store_stats['data_bytes'] = _data_size
+    _store_stats['live_bytes'] = live
+    return notes
+
+
+def write_store_index(rows, generation):
+    """Atomowo podmienia indeks - od tej chwili obowiązuje plik danych tej generacji"""
+    tmp_file = NOTES_INDEX_FILE + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump({'version': 1, 'generation': generation, 'notes': rows}, f,
+                  ensure_ascii=False, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, NOTES_INDEX_FILE)
+
+
+def note_body(note):
+    """Treść do pliku danych: bajty z prefiksem kodeka, jak w content_z"""
+    if note.content_z is not None:
+        return bytes(note.content_z)
+    return b'raw:' + note.content.encode('utf-8')
+
+
+def is_inline(note):
+    """Krótka treść trafia w całości do indeksu zamiast do pliku danych"""
+    return note.content_z is None and len(note.content or '') <= PREVIEW_LENGTH
+
+
+def index_row(note, offset, length):
+    head = note.preview if note.preview is not None else (note.content or '')[:PREVIEW_LENGTH]
+    return [note.id, note.title, note.color, note.timestamp, head, offset, length]
+
+
+def save_store(notes):
+    """Dopisuje nowe treści na koniec pliku danych i podmienia indeks (tylko wątek zapisu).
+
+    Niezmienione treści zostają na swoim miejscu, więc zapis kosztuje tyle,
+    ile zmienionych notatek plus mały indeks.
+    """
+    global _appended, _data_size
     try:
-        with open(NOTES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(notes, f, ensure_ascii=False, indent=2)
+        rows = []
+        appended = {}
+        live = 0
+        with open(data_path(_store_generation), 'ab') as data:
+            offset = data.tell()
+            for note in notes:
+                if is_inline(note):
+                    rows.append(index_row(note, -1, 0))
+                    continue
+
+                body = note.content_z
+                if isinstance(body, MappedBody) and body.loc[0] is _data_map:
+                    _, body_offset, length = body.loc
+                else:
+                    entry = _appended.get(note.id)
+                    if entry is not None and entry[0] is note:
+                        _, body_offset, length = entry
+                    else:
+                        blob = note_body(note)
+                        data.write(blob)
+                        body_offset, length = offset, len(blob)
+                        offset += length
+                    appended[note.id] = (note, body_offset, length)
+
+                live += length
+                rows.append(index_row(note, body_offset, length))
+            # Treści na dysku, zanim wskaże je nowy indeks
+            data.flush()
+            os.fsync(data.fileno())
+
+        write_store_index(rows, _store_generation)
+        _appended = appended
+        _data_size = offset
+        _store_stats['data_bytes'] = _data_size
+        _store_stats['live_bytes'] = live
+
+        if _data_size > COMPACT_MIN_BYTES and live < _data_size * (1 - COMPACT_GARBAGE_RATIO):
+            compact_store(notes)
+        return True
     except Exception as e:
         print(f"Błąd zapisu: {e}")
+        return False
+
+
+def compact_store(notes):
+    """Przepisuje aktualne treści do pliku danych nowej generacji i przełącza na niego indeks"""
+    global _store_generation, _data_map, _data_size, _appended
+    generation = _store_generation + 1
+    rows = []
+    relocated = []
+    appended = {}
+    offset = 0
+    with open(data_path(generation), 'wb') as data:
+        for note in notes:
+            if is_inline(note):
+                rows.append(index_row(note, -1, 0))
+                continue
+            blob = note_body(note)
+            data.write(blob)
+            if isinstance(note.content_z, MappedBody):
+                relocated.append((note.content_z, offset, len(blob)))
+            else:
+                appended[note.id] = (note, offset, len(blob))
+            rows.append(index_row(note, offset, len(blob)))
+            offset += len(blob)
+        data.flush()
+        os.fsync(data.fileno())
+
+    data_map = None
+    if offset > 0:
+        with open(data_path(generation), 'rb') as f:
+            data_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    write_store_index(rows, generation)
+    # Czytający w trakcie mają jeszcze stare mapowanie - zamknie się samo, gdy przestaną go używać
+    for body, body_offset, length in relocated:
+        body.loc = (data_map, body_offset, length)
+
+    old_path = data_path(_store_generation)
+    _store_generation = generation
+    _data_map = data_map
+    _data_size = offset
+    _appended = appended
+    _store_stats['data_bytes'] = offset
+    _store_stats['live_bytes'] = offset
+    _store_stats['compactions'] += 1
+    try:
+        os.remove(old_path)
+    except OSError:
+        pass
+
+
+def load_revisions():
+    """Pełny plik historii z naniesionym dziennikiem zmian"""
+    revisions = {}
+    if os.path.exists(REVISIONS_FILE):
+        try:
+            with open(REVISIONS_FILE, 'r', encoding='utf-8') as f:
+                revisions = {int(note_id): [Revision.from_json(data) for data in history]
+                             for note_id, history in json.load(f).items()}
+        except:
+            revisions = {}
+    if os.path.exists(REVISIONS_LOG_FILE):
+        with open(REVISIONS_LOG_FILE, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Urwana ostatnia linia po awarii w trakcie dopisywania
+                    continue
+                replay_revision_record(revisions, record)
+    return revisions
+
+
+def replay_revision_record(revisions, record):
+    """Nanosi wpis dziennika na historię; powtórzenie wpisu już zawartego w pliku historii nic nie zmienia"""
+    note_id = record['id']
+    history = revisions.get(note_id, [])
+    if 'add' in record:
+        revision = Revision.from_json(record['add'])
+        if not history or revision.rev > history[-1].rev:
+            revisions[note_id] = history + [revision]
+    elif 'trim' in record:
+        # Najstarsza zachowana wersja (po przycięciu zapisana w całości)
+        first = Revision.from_json(record['trim'])
+        if history and history[0].rev <= first.rev:
+            revisions[note_id] = [first] + [revision for revision in history if revision.rev > first.rev]
+    elif record.get('drop'):
+        revisions.pop(note_id, None)
+
+
+def revision_record(note_id, op, revision):
+    if op == 'drop':
+        return {'id': note_id, 'drop': True}
+    return {'id': note_id, op: revision.to_json()}
+
+
+def append_revision_log(pending):
+    """Dopisuje zmiany historii do dziennika - koszt zależy od zmian, a nie od rozmiaru całej historii"""
+    try:
+        with open(REVISIONS_LOG_FILE, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(revision_record(*entry), ensure_ascii=False) + '\n' for entry in pending))
+        return True
+    except Exception as e:
+        print(f"Błąd zapisu historii: {e}")
+        return False
+
+
+def revision_log_needs_compaction():
+    try:
+        log_size = os.path.getsize(REVISIONS_LOG_FILE)
+    except OSError:
+        return False
+    try:
+        file_size = os.path.getsize(REVISIONS_FILE)
+    except OSError:
+        file_size = 0
+    return log_size > max(REVISIONS_LOG_COMPACT, file_size)
+
+
+def save_revisions(revisions):
+    """Scala dziennik z plikiem historii: zapis całości atomowo (plik tymczasowy + rename), potem pusty dziennik"""
+    tmp_file = REVISIONS_FILE + '.tmp'
+    try:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({str(note_id): [revision.to_json() for revision in history]
+                       for note_id, history in revisions.items()}, f, ensure_ascii=False)
+        os.replace(tmp_file, REVISIONS_FILE)
+        # Awaria przed wyczyszczeniem dziennika nie szkodzi - jego wpisy są już w pliku historii
+        open(REVISIONS_LOG_FILE, 'w').close()
+        return True
+    except Exception as e:
+        print(f"Błąd zapisu historii: {e}")
+        return False
+
+
+def get_notes_store():
+    """Zwraca notatki trzymane w pamięci (wczytuje je przy pierwszym użyciu)
+
+    Słownik id -> Note w kolejności dodania: zmiana i usunięcie notatki po id
+    bez przeglądania całego magazynu.
+    """
+    global _notes, _dirty_since, _superseded_file
+    with _notes_lock:
+        if _notes is None:
+            # Istniejący indeks jest zawsze aktualniejszy niż notes.json - także przy MMAP_STORE = False
+            notes = load_store()
+            if notes is None:
+                notes = [Note.from_json(data) for data in load_notes()]
+                if MMAP_STORE and os.path.exists(NOTES_FILE):
+                    _superseded_file = NOTES_FILE
+            elif not MMAP_STORE:
+                _superseded_file = NOTES_INDEX_FILE
+
+            if _superseded_file is not None:
+                # Zmiana formatu: zapis w bieżącym formacie, potem stary plik przestaje być czytany
+                _dirty_since = time.monotonic()
+                start_flusher()
+                _flush_wakeup.set()
+            _notes = {note.id: note for note in notes}
+        return _notes
+
+
+def retire_superseded_file():
+    """Po udanym zapisie w nowym formacie zmienia nazwę pliku starego formatu (nieaktualnego od tej chwili)"""
+    global _superseded_file
+    if _superseded_file is None:
+        return
+    try:
+        if os.path.exists(_superseded_file):
+            os.replace(_superseded_file, _superseded_file + '.migrated')
+            print(f"📦 {_superseded_file} przeniesiony do {_superseded_file}.migrated - nie jest już aktualny")
+        _superseded_file = None
+    except OSError as e:
+        print(f"Błąd zmiany nazwy {_superseded_file}: {e}")
+
+
+def modified_key(note):
+    """Czas modyfikacji do indeksu; notatki bez poprawnego czasu na początku (jak NULL w SQLite)"""
+    modified = note.modified
+    return modified if modified is not None else float('-inf')
+
+
+def title_key(note):
+    return (text_value(note.title) or '').casefold()
+
+
+def build_note_index(notes):
+    """Indeksy listy: id -> notatka oraz posortowane listy kluczy (wartość, id)
+
+    ids - id rosnąco, modified - (czas, id), title - (tytuł, id),
+    suggest - (suggest_key tytułu, id) pod podpowiedzi po prefiksie,
+    color - kolor -> (czas, id) tylko dla notatek w tym kolorze
+    """
+    by_id = {note.id: note for note in notes}
+    color = {}
+    for note in by_id.values():
+        color.setdefault(note.color, []).append((modified_key(note), note.id))
+    for keys in color.values():
+        keys.sort()
+    return {
+        'by_id': by_id,
+        'ids': sorted(by_id),
+        'modified': sorted((modified_key(note), note.id) for note in by_id.values()),
+        'title': sorted((title_key(note), note.id) for note in by_id.values()),
+        'suggest': sorted((suggest_key(note.title), note.id) for note in by_id.values()),
+        'color': color,
+    }
+
+
+def get_note_index():
+    """Indeksy notatek - budowane przy pierwszym użyciu, potem utrzymywane przez index_add/index_remove"""
+    global _note_index
+    with _notes_lock:
+        if _note_index is None:
+            _note_index = build_note_index(get_notes_store().values())
+        return _note_index
+
+
+def invalidate_note_index():
+    """Po wymianie wielu notatek naraz (import, replikacja) indeks jest budowany od nowa"""
+    global _note_index
+    with _notes_lock:
+        _note_index = None
+
+
+def _sorted_remove(keys, key):
+    position = bisect_left(keys, key)
+    if position < len(keys) and keys[position] == key:
+        del keys[position]
+
+
+def index_add(note):
+    """Dopisuje notatkę do indeksów - wywoływać pod _notes_lock"""
+    if _note_index is None:
+        return
+    _note_index['by_id'][note.id] = note
+    insort(_note_index['ids'], note.id)
+    insort(_note_index['modified'], (modified_key(note), note.id))
+    insort(_note_index['title'], (title_key(note), note.id))
+    insort(_note_index['suggest'], (suggest_key(note.title), note.id))
+    insort(_note_index['color'].setdefault(note.color, []), (modified_key(note), note.id))
+
+
+def index_remove(note):
+    """Usuwa notatkę z indeksów - wywoływać pod _notes_lock"""
+    if _note_index is None:
+        return
+    _note_index['by_id'].pop(note.id, None)
+    _sorted_remove(_note_index['ids'], note.id)
+    _sorted_remove(_note_index['modified'], (modified_key(note), note.id))
+    _sorted_remove(_note_index['title'], (title_key(note), note.id))
+    _sorted_remove(_note_index['suggest'], (suggest_key(note.title), note.id))
+    color_keys = _note_index['color'].get(note.color)
+    if color_keys is not None:
+        _sorted_remove(color_keys, (modified_key(note), note.id))
+        if not color_keys:
+            del _note_index['color'][note.color]
+
+
+def _remove_oldest(keys, removed, count):
+    """Usuwa z listy (czas, id) count kluczy notatek removed; najstarsze notatki (archiwizacja)
+    leżą na początku listy, zaraz za notatkami bez poprawnego czasu - wtedy wystarczy jeden wycinek
+    """
+    start = end = bisect_right(keys, (float('-inf'), float('inf')))
+    while end < len(keys) and keys[end][1] in removed:
+        end += 1
+    del keys[start:end]
+    if end - start < count:
+        keys[:] = [key for key in keys if key[1] not in removed]
+
+
+def index_remove_many(notes):
+    """Usuwa wiele notatek z indeksów jednym przejściem każdej listy - wywoływać pod _notes_lock"""
+    if _note_index is None or not notes:
+        return
+    removed = {note.id for note in notes}
+    colors = {}
+    for note in notes:
+        _note_index['by_id'].pop(note.id, None)
+        colors[note.color] = colors.get(note.color, 0) + 1
+    _note_index['ids'] = [note_id for note_id in _note_index['ids'] if note_id not in removed]
+    for name in ('title', 'suggest'):
+        _note_index[name] = [key for key in _note_index[name] if key[1] not in removed]
+    _remove_oldest(_note_index['modified'], removed, len(removed))
+    for color, count in colors.items():
+        color_keys = _note_index['color'].get(color)
+        if color_keys is not None:
+            _remove_oldest(color_keys, removed, count)
+            if not color_keys:
+                del _note_index['color'][color]
+
+
+def query_notes(color=None, after=None, before=None, sort=None):
+    """Notatki przefiltrowane i posortowane przez indeksy (bez przeglądania całej listy)"""
+    with _notes_lock:
+        index = get_note_index()
+        by_id = index['by_id']
+
+        if color is None and after is None and before is None:
+            if sort is None:
+                return list(get_notes_store().values())
+            if sort == 'created':
+                return [by_id[note_id] for note_id in reversed(index['ids'])]
+            if sort == 'title':
+                return [by_id[note_id] for _, note_id in index['title']]
+            return [by_id[note_id] for _, note_id in reversed(index['modified'])]
+
+        # Zakres czasu wycinany bisekcją z indeksu koloru albo indeksu czasu; przy filtrze czasu
+        # notatki bez poprawnego czasu (klucz -inf) odpadają, jak NULL w warunku SQL
+        keys = index['color'].get(color, []) if color is not None else index['modified']
+        if after is not None:
+            low = bisect_right(keys, (after, float('inf')))
+        elif before is not None:
+            low = bisect_right(keys, (float('-inf'), float('inf')))
+        else:
+            low = 0
+        high = bisect_left(keys, (before,)) if before is not None else len(keys)
+        selected = [by_id[note_id] for _, note_id in reversed(keys[low:high])]
+
+    # Sortowanie już tylko wybranych notatek; bez ?sort= - kolejność dodania (id rosnąco)
+    if sort == 'title':
+        selected.sort(key=lambda note: (title_key(note), note.id))
+    elif sort == 'created':
+        selected.sort(key=lambda note: note.id, reverse=True)
+    elif sort is None:
+        selected.sort(key=lambda note: note.id)
+    return selected
+
+
+def suggest_notes(prefix, limit):
+    """Pierwsze (alfabetycznie) notatki, których tytuł zaczyna się od prefix - bisekcja w indeksie suggest"""
+    if not prefix:
+        return []
+    with _notes_lock:
+        index = get_note_index()
+        keys = index['suggest']
+        position = bisect_left(keys, (prefix,))
+        matches = []
+        for key, note_id in keys[position:position + limit]:
+            if not key.startswith(prefix):
+                break
+            matches.append(index['by_id'][note_id])
+    return matches
+
+
+def next_note_id():
+    """Id dla nowej notatki - wywoływać pod _notes_lock
+
+    Licznik startuje od największego id w magazynie i archiwum (liczonego raz),
+    więc id nie powtarzają się także po usunięciu najnowszej notatki.
+    """
+    global _last_id
+    if _last_id is None:
+        _last_id = max(max(get_notes_store(), default=0), max_archived_id(NOTES_FILE))
+    _last_id += 1
+    return _last_id
+
+
+def reserve_note_id(note_id):
+    """Uwzględnia w liczniku id nadane z zewnątrz (import) - wywoływać pod _notes_lock"""
+    global _last_id
+    if _last_id is not None and note_id > _last_id:
+        _last_id = note_id
+
+
+def archive_stale_notes(now=None):
+    """Przenosi do archiwum notatki nieruszane dłużej niż ARCHIVE_AFTER; zwraca ich liczbę"""
+    now = time.time() if now is None else now
+    archived = 0
+    # Kandydaci raz, z indeksu czasu (bez notatek bez poprawnego czasu - klucz -inf);
+    # potem partiami, z blokadą zwalnianą między partiami
+    with _notes_lock:
+        keys = get_note_index()['modified']
+        low = bisect_right(keys, (float('-inf'), float('inf')))
+        candidates = [note_id for _, note_id in keys[low:bisect_left(keys, (now - ARCHIVE_AFTER,))]]
+
+    # Każda partia to jedno przejście list indeksów (O(n)) - przy dużym magazynie partie rosną,
+    # żeby przejść było najwyżej ok. 50
+    with _notes_lock:
+        batch = max(ARCHIVE_BATCH, len(get_notes_store()) // 50)
+    for start in range(0, len(candidates), batch):
+        with _notes_lock:
+            notes = get_notes_store()
+            stale = [notes[note_id] for note_id in candidates[start:start + batch] if note_id in notes]
+        # Notatki zmienione od zebrania kandydatów już nie są stare
+        stale = [note for note in stale if is_stale(note, now)]
+        if not stale:
+            continue
+
+        # Najpierw zapis w archiwum (poza blokadą), potem usunięcie z magazynu roboczego
+        store_archived(NOTES_FILE, stale)
+        with _notes_lock:
+            notes = get_notes_store()
+            moved = [note for note in stale if notes.get(note.id) is note]
+            for note in moved:
+                del notes[note.id]
+                # Wersje archiwalnej notatki są starsze niż REVISIONS_MAX_AGE
+                drop_revisions(note.id)
+            index_remove_many(moved)
+
+        # Notatki zmienione lub usunięte w międzyczasie zostają tylko w magazynie roboczym
+        moved_ids = {note.id for note in moved}
+        remove_archived(NOTES_FILE, [note.id for note in stale if note.id not in moved_ids])
+        if moved:
+            archived += len(moved)
+            mark_dirty()
+
+    record_archive_pass(archived)
+    return archived
+
+
+def restore_archived(note_id):
+    """Przywraca notatkę z archiwum do magazynu roboczego; zwraca Note albo None, gdy jej tam nie ma"""
+    note = get_archived(NOTES_FILE, note_id)
+    if note is None:
+        return None
+    note = hot_note(note)
+    with _notes_lock:
+        index = get_note_index()
+        if note_id not in index['by_id']:
+            # Wraca na koniec magazynu, jak zmieniona przed chwilą notatka
+            get_notes_store()[note_id] = note
+            index_add(note)
+    remove_archived(NOTES_FILE, [note_id])
+    record_restore()
+    mark_dirty()
+    return note
+
+
+def _archive_loop():
+    while True:
+        time.sleep(ARCHIVE_INTERVAL)
+        try:
+            archive_stale_notes()
+        except (OSError, sqlite3.Error) as e:
+            print(f"Błąd archiwizacji: {e}")
+
+
+def start_archiver():
+    """Uruchamia wątek archiwizacji w tle (tylko raz; replika trzyma wszystkie notatki w magazynie roboczym)"""
+    global _archiver_thread
+    if ARCHIVE and ARCHIVE_INTERVAL > 0 and not REPLICA_OF and _archiver_thread is None:
+        _archiver_thread = threading.Thread(target=_archive_loop, name='archiver', daemon=True)
+        _archiver_thread.start()
+
+
+def get_revisions_store():
+    """Historia wersji w pamięci (wczytywana przy pierwszym użyciu)"""
+    global _revisions
+    with _notes_lock:
+        if _revisions is None:
+            _revisions = load_revisions()
+        return _revisions
+
+
+def drop_revisions(note_id):
+    """Usuwa historię notatki - wywoływać pod _notes_lock"""
+    if get_revisions_store().pop(note_id, None) is not None:
+        _revision_log.append((note_id, 'drop', None))
+
+
+def record_revision(note, force=False):
+    """Zapisuje stan notatki w historii przed jej nadpisaniem - wywoływać pod _notes_lock.
+
+    force - zapisz także w serii autozapisów (np. przed przywróceniem wersji)
+    """
+    revisions = get_revisions_store()
+    history = revisions.get(note.id, [])
+    content = note.get_content()
+    now = time.time()
+
+    base = None
+    if history:
+        last = history[-1]
+        # Seria autozapisów - stan sprzed jej początku już jest w historii
+        if not force and now - last.created < REVISION_MIN_INTERVAL:
+            return
+        chain = revision_chain(history, last.rev)
+        base = revision_content(chain)
+        if base == content and last.title == note.title and last.color == note.color:
+            return
+        if len(chain) >= REVISION_KEYFRAME_INTERVAL:
+            base = None
+
+    revision = Revision.capture(history[-1].rev + 1 if history else 1, note, now, content, base)
+    # Nowa lista zamiast dopisywania w miejscu - scalanie dziennika pracuje na migawce
+    history = history + [revision]
+    kept = trim_revisions(history, now)
+    revisions[note.id] = kept
+    _revision_log.append((note.id, 'add', revision))
+    if kept is not history:
+        _revision_log.append((note.id, 'trim', kept[0]))
+
+
+def trim_revisions(history, now):
+    """Historia bez wersji ponad REVISIONS_KEEP i starszych niż REVISIONS_MAX_AGE"""
+    newest = history[-1].rev
+    young = next((revision.rev for revision in history if revision.created >= now - REVISIONS_MAX_AGE), newest)
+    first = max(newest - REVISIONS_KEEP + 1, young)
+    if first <= history[0].rev:
+        return history
+
+    kept = [revision for revision in history if revision.rev >= first]
+    if not kept[0].keyframe:
+        # Najstarsza zachowana wersja musi dać się odtworzyć bez usuwanych - zapisz ją w całości
+        oldest = kept[0]
+        kept[0] = Revision(oldest.rev, oldest.created, oldest.title, oldest.color, oldest.timestamp, True,
+                           pack_text(revision_content(revision_chain(history, first))))
+    return kept
+
+
+def apply_note_update(note_id, changes, force_revision=False):
+    """Zmienia pola notatki (poprzedni stan trafia do historii); zwraca Note albo None.
+
+    Wywoływać pod _notes_lock, a po zwolnieniu blokady - mark_dirty().
+    """
+    notes = get_notes_store()
+    note = notes.get(note_id)
+    if note is None:
+        return None
+    record_revision(note, force_revision)
+    # Nowy obiekt zamiast zmiany w miejscu - migawki widzą starą wersję
+    index_remove(note)
+    note = note.replace(timestamp=datetime.now().isoformat(), **changes)
+    notes[note_id] = note
+    index_add(note)
+    log_change('upsert', note_id)
+    return note
+
+
+def snapshot_notes():
+    """Spójna migawka notatek - płytka kopia listy (notatki są niezmienne po zapisaniu w magazynie)"""
+    with _notes_lock:
+        return list(get_notes_store().values())
+
+
+def mark_dirty():
+    """Oznacza stan w pamięci jako niezapisany i budzi wątek zapisujący"""
+    global _dirty_since
+    with _notes_lock:
+        if _dirty_since is None:
+            _dirty_since = time.monotonic()
+    invalidate_lists(NOTES_FILE)
+
+    if not WRITE_BEHIND:
+        flush_notes()
+        return
+
+    start_flusher()
+    _flush_wakeup.set()
+
+
+def flush_notes():
+    """Zapisuje na dysk bieżący stan, jeśli są niezapisane zmiany"""
+    global _dirty_since, _revision_log
+    with _flush_lock:
+        # Migawka pod blokadą, serializacja i zapis już bez niej
+        with _notes_lock:
+            if _dirty_since is None:
+                return True
+            dirty_since = _dirty_since
+            _dirty_since = None
+            snapshot = list(get_notes_store().values())
+            pending = _revision_log
+            _revision_log = []
+            # Migawka historii tylko do scalenia - zawiera wszystkie zmiany z pending
+            revisions = dict(_revisions) if pending and revision_log_needs_compaction() else None
+
+        started = time.monotonic()
+        ok = save_store(snapshot) if MMAP_STORE else save_notes(snapshot)
+        if pending and (save_revisions(revisions) if revisions is not None else append_revision_log(pending)):
+            pending = []
+        ok = ok and not pending
+        finished = time.monotonic()
+
+        if ok:
+            retire_superseded_file()
+            _flush_stats['flushes'] += 1
+            _flush_stats['last_flush_at'] = datetime.now().isoformat()
+            _flush_stats['last_flush_duration_ms'] = (finished - started) * 1000
+            _flush_stats['last_flush_lag_ms'] = (finished - dirty_since) * 1000
+        else:
+            _flush_stats['errors'] += 1
+            with _notes_lock:
+                # Zmiany wciąż czekają na zapis - zachowaj czas najstarszej
+                if _dirty_since is None or dirty_since < _dirty_since:
+                    _dirty_since = dirty_since
+                # Niezapisane zmiany historii przed nowszymi (ponowne dopisanie wpisu jest nieszkodliwe)
+                _revision_log = pending + _revision_log
+        return ok
+
+
+def _flusher_loop():
+    last_flush = 0.0
+    while True:
+        _flush_wakeup.wait()
+        _flush_wakeup.clear()
+
+        # Ogranicz częstotliwość zapisów - zmiany z tego okna trafią do jednego zapisu
+        wait = FLUSH_INTERVAL - (time.monotonic() - last_flush)
+        if wait > 0:
+            time.sleep(wait)
+
+        if not flush_notes():
+            _flush_wakeup.set()
+        last_flush = time.monotonic()
+
+
+def start_flusher():
+    """Uruchamia wątek zapisujący w tle (tylko raz)"""
+    global _flusher_thread
+    with _flusher_start_lock:
+        if _flusher_thread is None:
+            _flusher_thread = threading.Thread(target=_flusher_loop, name='notes-flusher', daemon=True)
+            _flusher_thread.start()
+
+
+def flush_stats():
+    """Metryki zapisu w tle, w tym bieżące opóźnienie zapisu (flush lag)"""
+    with _notes_lock:
+        dirty_since = _dirty_since
+    lag_ms = (time.monotonic() - dirty_since) * 1000 if dirty_since is not None else 0.0
+    return {
+        'write_behind': WRITE_BEHIND,
+        'dirty': dirty_since is not None,
+        'flush_lag_ms': lag_ms,
+        **_flush_stats,
+        'mmap_store': {'enabled': MMAP_STORE, 'generation': _store_generation, **_store_stats},
+    }
+
+
+def backup_notes():
+    """Zapisuje migawkę notatek do BACKUP_DIR; zwraca ścieżkę lub None przy błędzie"""
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    target = os.path.join(BACKUP_DIR, f"notes-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.json")
+
+    with _backup_lock:
+        started = time.monotonic()
+        # Migawka obejmuje też archiwum - jest kompletną kopią notatek
+        snapshot = snapshot_notes()
+        hot_ids = {note.id for note in snapshot}
+        snapshot += [note for note in iter_archived(NOTES_FILE) if note.id not in hot_ids]
+        if not save_notes(snapshot, target):
+            _backup_stats['errors'] += 1
+            return None
+
+        rotate_backups()
+        _backup_stats['backups'] += 1
+        _backup_stats['last_backup_at'] = datetime.now().isoformat()
+        _backup_stats['last_backup_duration_ms'] = (time.monotonic() - started) * 1000
+
+    return target
+
+
+def list_backups():
+    """Migawki notatek, od najstarszej"""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    pattern = re.compile(r'^notes-\d{8}-\d{6}-\d{6}\.json$')
+    return sorted(f for f in os.listdir(BACKUP_DIR) if pattern.match(f))
+
+
+def rotate_backups():
+    """Usuwa najstarsze migawki ponad BACKUP_KEEP"""
+    backups = list_backups()
+    for old in backups[:max(0, len(backups) - BACKUP_KEEP)]:
+        os.remove(os.path.join(BACKUP_DIR, old))
+
+
+def _backup_loop():
+    while True:
+        time.sleep(BACKUP_INTERVAL)
+        backup_notes()
+
+
+def start_backup_scheduler():
+    """Uruchamia wątek migawek w tle (tylko raz)"""
+    global _backup_thread
+    if BACKUP_INTERVAL > 0 and _backup_thread is None:
+        _backup_thread = threading.Thread(target=_backup_loop, name='backup-scheduler', daemon=True)
+        _backup_thread.start()
+
+
+def log_change(op, note_id=None):
+    """Dopisuje zmianę do dziennika replikacji - wywoływać pod _notes_lock.
+
+    op: 'upsert' (dodanie/zmiana), 'delete' albo 'reset' (np. po imporcie -
+    repliki pobierają wtedy pełną kopię zamiast pojedynczych zmian).
+    Dziennik nie trzyma notatek - get_changes wysyła ich bieżącą wersję.
+    """
+    global _change_seq
+    _change_seq += 1
+    _changes.append((_change_seq, op, note_id, time.time()))
+
+
+def resync_from_primary():
+    """Pobiera pełną kopię notatek z primary i podmienia lokalny magazyn"""
+    global _notes, _last_id, _replica_epoch, _replica_seq
+    with fetch_from_primary('/api/replication/snapshot') as response:
+        epoch = response.headers['X-Replication-Epoch']
+        seq = int(response.headers['X-Replication-Seq'])
+        notes = [Note.from_json(data) for data in read_ndjson(response)]
+
+    with _notes_lock:
+        _notes = {note.id: note for note in notes}
+        _last_id = None
+        invalidate_note_index()
+        _replica_epoch = epoch
+        _replica_seq = seq
+    mark_dirty()
+
+    _replication_stats['resyncs'] += 1
+    _replication_stats['applied_seq'] = seq
+
+
+def sync_from_primary():
+    """Pobiera i stosuje kolejne zmiany z dziennika primary; zwraca True, gdy replika nadąża"""
+    global _replica_seq
+    with fetch_from_primary(
+            f'/api/replication/changes?since={_replica_seq}&epoch={_replica_epoch}&limit={REPLICATION_BATCH}') as response:
+        data = json.load(response)
+
+    _replication_stats['primary_seq'] = data['seq']
+    if data['reset'] or any(change['op'] == 'reset' for change in data['changes']):
+        resync_from_primary()
+        return False
+
+    if data['changes']:
+        with _notes_lock:
+            # Zmiany stosowane po kolei, w miejscu - indeksy uzupełniane notatka po notatce
+            notes = get_notes_store()
+            for change in data['changes']:
+                old = notes.pop(change['id'], None) if change['op'] == 'delete' else notes.get(change['id'])
+                if old is not None:
+                    index_remove(old)
+                if change['op'] == 'upsert':
+                    note = notes[change['id']] = Note.from_json(change['note'])
+                    index_add(note)
+                _replica_seq = change['seq']
+        mark_dirty()
+
+    _replication_stats['applied_seq'] = _replica_seq
+    _replication_stats['last_sync_at'] = time.time()
+    return _replica_seq >= data['seq']
+
+
+def _replication_loop():
+    while True:
+        try:
+            if sync_from_primary():
+                _replication_stats['caught_up_at'] = time.time()
+                time.sleep(REPLICATION_POLL_INTERVAL)
+        except (OSError, ValueError, KeyError) as e:
+            _replication_stats['errors'] += 1
+            _replication_stats['last_error'] = str(e)
+            time.sleep(REPLICATION_POLL_INTERVAL)
+
+
+def start_replication():
+    """Uruchamia wątek repliki (tylko gdy ustawiono KEEP_REPLICA_OF)"""
+    global _replication_thread
+    if REPLICA_OF and _replication_thread is None:
+        _replication_thread = threading.Thread(target=_replication_loop, name='replication', daemon=True)
+        _replication_thread.start()
+
+
+def _handle_shutdown_signal(signum, frame):
+    flush_notes()
+    sys.exit(0)
+
+
+def _handle_flush_signal(signum, frame):
+    flush_notes()
+
+
+def install_signal_handlers():
+    """Zapis przy zamknięciu (SIGTERM/SIGINT) i na żądanie (SIGUSR1)"""
+    signal.signal(signal.SIGTERM, _handle_shutdown_signal)
+    signal.signal(signal.SIGINT, _handle_shutdown_signal)
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, _handle_flush_signal)
+
+
+atexit.register(flush_notes)
 
 
 # HTML TEMPLATE - cała aplikacja w przeglądarce
@@ -87,7 +1127,14 @@ HTML_TEMPLATE = '''
             max-height: calc(100vh - 200px);
         }
 
+        .notes-spacer { position: relative; }
+
         .note-item {
+            position: absolute;
+            left: 0;
+            right: 0;
+            height: 64px;
+            overflow: hidden;
             padding: 12px 15px;
             border-bottom: 1px solid #f0f0f0;
             cursor: pointer;
@@ -101,6 +1148,9 @@ HTML_TEMPLATE = '''
             font-weight: bold; 
             margin-bottom: 4px;
             font-size: 14px;
+            white-space: nowrap;
+            overflow: hidden;
+            text-overflow: ellipsis;
         }
 
         .note-preview { 
@@ -207,8 +1257,11 @@ HTML_TEMPLATE = '''
     <div class="container">
         <div class="notes-panel">
             <div class="notes-header">
-                <h3>📋 Notatki</h3>
-                <button class="btn btn-primary" onclick="createNote()">➕ Nowa</button>
+                <h3 id="notes-heading">📋 Notatki</h3>
+                <div>
+                    <button class="btn btn-secondary" id="archive-toggle" onclick="toggleArchive()">🗄️ Archiwum</button>
+                    <button class="btn btn-primary" onclick="createNote()">➕ Nowa</button>
+                </div>
             </div>
             <div class="notes-list" id="notes-list">
                 <div class="empty-state">
@@ -238,31 +1291,342 @@ HTML_TEMPLATE = '''
 
     <script>
         let notes = [];
+        let notesById = new Map();
         let currentNote = null;
 
-        // Ładowanie notatek przy starcie
-        document.addEventListener('DOMContentLoaded', function() {
+        // Wirtualizowana lista: w DOM są tylko widoczne wiersze, aktualizowane po id
+        const NOTE_ROW_HEIGHT = 64;
+        const OVERSCAN_ROWS = 8;
+        let rowsById = new Map();
+        let notesSpacer = null;
+        let renderScheduled = false;
+
+        // Lokalna kopia notatek (IndexedDB) i kolejka zmian czekających na serwer
+        // Notatnik z adresu strony (?notebook=...) - serwer SQLite trzyma każdy w osobnym pliku
+        const NOTEBOOK = new URLSearchParams(location.search).get('notebook');
+        const LOCAL_DB_NAME = NOTEBOOK ? `keep-notatki-${NOTEBOOK}` : 'keep-notatki';
+        const LOCAL_DB_VERSION = 1;
+        const MAX_RETRY_DELAY = 60000;
+        let localDb = null;
+        let pendingOps = [];
+        let nextOpSeq = 1;
+        let syncing = false;
+        let inFlightSeq = null; // seq zmiany właśnie wysyłanej - nie wolno jej usunąć z kolejki
+        let syncError = null; // ostatni błąd odrzuconej przez serwer zmiany (zostaje w kolejce)
+        let retryDelay = 1000;
+        let retryTimer = null;
+        let backoffUntil = 0; // do tej chwili (Date.now()) nie wysyłamy żądań w tle - serwer prosił o przerwę
+
+        // Widok archiwum: notatki długo nieruszane, pobierane tylko na żądanie (bez odświeżania
+        // co 5 sekund i bez lokalnej kopii); workingNotes - lista robocza na czas przeglądania archiwum
+        let showArchived = false;
+        let workingNotes = null;
+
+        // Ładowanie notatek przy starcie - najpierw z lokalnej kopii, potem z serwera
+        document.addEventListener('DOMContentLoaded', async function() {
+            await openLocalDb();
+            const notesList = document.getElementById('notes-list');
+            notesList.addEventListener('scroll', scheduleRenderNotesList);
+            notesList.addEventListener('click', event => {
+                const row = event.target.closest('.note-item');
+                if (row) selectNote(Number(row.dataset.id));
+            });
+            window.addEventListener('resize', scheduleRenderNotesList);
+
+            await loadLocalState();
             loadNotes();
-            setInterval(loadNotes, 5000); // Odświeżaj co 5 sekund
+            setInterval(() => { if (!showArchived) loadNotes(); }, 5000); // Odświeżaj co 5 sekund
+            window.addEventListener('online', syncQueue);
         });
 
+        function openLocalDb() {
+            return new Promise(resolve => {
+                if (!window.indexedDB) {
+                    resolve(null);
+                    return;
+                }
+                const request = indexedDB.open(LOCAL_DB_NAME, LOCAL_DB_VERSION);
+                request.onupgradeneeded = () => {
+                    request.result.createObjectStore('notes', { keyPath: 'id' });
+                    request.result.createObjectStore('queue', { keyPath: 'seq' });
+                };
+                request.onsuccess = () => {
+                    localDb = request.result;
+                    resolve(localDb);
+                };
+                request.onerror = () => resolve(null);
+            });
+        }
+
+        // Wykonuje operacje na magazynie IndexedDB w jednej transakcji
+        function localTx(storeName, mode, fn) {
+            return new Promise(resolve => {
+                if (!localDb) {
+                    resolve(undefined);
+                    return;
+                }
+                const tx = localDb.transaction(storeName, mode);
+                const request = fn(tx.objectStore(storeName));
+                tx.oncomplete = () => resolve(request ? request.result : undefined);
+                tx.onerror = () => resolve(undefined);
+            });
+        }
+
+        async function loadLocalState() {
+            const cachedNotes = await localTx('notes', 'readonly', store => store.getAll());
+            const cachedOps = await localTx('queue', 'readonly', store => store.getAll());
+
+            pendingOps = cachedOps || [];
+            pendingOps.sort((a, b) => a.seq - b.seq);
+            nextOpSeq = pendingOps.length > 0 ? pendingOps[pendingOps.length - 1].seq + 1 : 1;
+
+            if (cachedNotes && cachedNotes.length > 0) {
+                // Kolejność jak z serwera: najpierw zapisane, nowe (tymczasowe id) na końcu
+                const rank = note => note.order ?? Number.MAX_SAFE_INTEGER;
+                setNotes(cachedNotes.sort((a, b) => rank(a) - rank(b)));
+                renderNotesList();
+                updateCount();
+                updateStatus(`Załadowano ${notes.length} notatek z pamięci lokalnej`);
+            }
+        }
+
+        function cacheNote(note) {
+            return localTx('notes', 'readwrite', store => store.put(note));
+        }
+
+        function uncacheNote(noteId) {
+            return localTx('notes', 'readwrite', store => store.delete(noteId));
+        }
+
+        // Zapisuje w IndexedDB tylko notatki, które zmieniły się od ostatniego odczytu
+        function cacheServerNotes(previousNotes, serverNotes) {
+            const previous = new Map(previousNotes.map(note => [note.id, note]));
+            return localTx('notes', 'readwrite', store => {
+                serverNotes.forEach((note, index) => {
+                    note.order = index;
+                    const old = previous.get(note.id);
+                    previous.delete(note.id);
+                    if (!old || old.timestamp !== note.timestamp || old.order !== index) {
+                        store.put(note);
+                    }
+                });
+                previous.forEach((note, noteId) => store.delete(noteId));
+                return null;
+            });
+        }
+
+        function enqueueOp(op) {
+            // Starsze zmiany tej samej notatki są zbędne - wysyłamy pełny stan;
+            // zmiana w trakcie wysyłania zostaje, syncQueue usunie ją po odpowiedzi serwera
+            const queued = pending => pending.seq !== inFlightSeq && pending.noteId === op.noteId;
+            if (op.type === 'update') {
+                dropOps(pending => queued(pending) && pending.type === 'update');
+            }
+            if (op.type === 'delete') {
+                // Notatka, której serwer jeszcze nie dostał, znika bez żądania DELETE
+                const unsynced = pendingOps.some(pending => queued(pending) && pending.type === 'create');
+                dropOps(queued);
+                if (unsynced) return;
+            }
+
+            op.seq = nextOpSeq++;
+            pendingOps.push(op);
+            localTx('queue', 'readwrite', store => store.put(op));
+        }
+
+        function dropOps(predicate) {
+            const dropped = pendingOps.filter(predicate);
+            if (dropped.length === 0) return;
+            pendingOps = pendingOps.filter(op => !predicate(op));
+            localTx('queue', 'readwrite', store => {
+                dropped.forEach(op => store.delete(op.seq));
+                return null;
+            });
+        }
+
+        async function apiFetch(url, options = {}) {
+            const headers = { ...(options.headers || {}) };
+            if (NOTEBOOK) headers['X-Notebook'] = NOTEBOOK;
+            const response = await fetch(url, { ...options, headers });
+            if (response.status === 429 || response.status === 503) {
+                // Limit żądań lub przeciążenie - wstrzymaj odświeżanie i kolejkę na czas z Retry-After
+                const seconds = parseInt(response.headers.get('Retry-After'), 10);
+                backoffUntil = Date.now() + (seconds > 0 ? seconds * 1000 : retryDelay);
+            }
+            return response;
+        }
+
+        function sendOp(op) {
+            const headers = { 'Content-Type': 'application/json' };
+            if (op.type === 'create') {
+                return apiFetch('/api/notes', { method: 'POST', headers, body: JSON.stringify(op.data) });
+            }
+            if (op.type === 'update') {
+                return apiFetch(`/api/notes/${op.noteId}`, { method: 'PUT', headers, body: JSON.stringify(op.data) });
+            }
+            return apiFetch(`/api/notes/${op.noteId}`, { method: 'DELETE' });
+        }
+
+        // Odtwarza kolejkę zmian po kolei; przy braku sieci lub przeciążeniu serwera ponawia z opóźnieniem
+        async function syncQueue() {
+            if (syncing || Date.now() < backoffUntil) return;
+            syncing = true;
+            try {
+                while (pendingOps.length > 0) {
+                    const op = pendingOps[0];
+                    inFlightSeq = op.seq;
+                    const response = await sendOp(op);
+
+                    if (response.status === 429 || response.status >= 500) {
+                        scheduleRetry(response.headers.get('Retry-After'));
+                        setConnectionStatus(false);
+                        return;
+                    }
+
+                    if (!response.ok && response.status !== 404) {
+                        // Odrzucona zmiana (np. 403 na replice) zostaje w kolejce - nie gubimy edycji
+                        const body = await response.json().catch(() => ({}));
+                        syncError = body.error || `HTTP ${response.status}`;
+                        updateStatus(`❌ Nie zapisano na serwerze: ${syncError}`);
+                        scheduleRetry(null);
+                        return;
+                    }
+
+                    if (op.type === 'create' && response.ok) {
+                        await remapNoteId(op.noteId, await response.json());
+                    }
+
+                    // 404 (notatka usunięta w innym miejscu) - nie ma już czego zmieniać
+                    syncError = null;
+                    pendingOps = pendingOps.filter(pending => pending.seq !== op.seq);
+                    await localTx('queue', 'readwrite', store => store.delete(op.seq));
+                }
+                retryDelay = 1000;
+                setConnectionStatus(true);
+            } catch (error) {
+                scheduleRetry(null);
+                setConnectionStatus(false);
+            } finally {
+                inFlightSeq = null;
+                syncing = false;
+            }
+        }
+
+        function scheduleRetry(retryAfter) {
+            if (retryTimer) return;
+            const seconds = parseInt(retryAfter, 10);
+            const delay = seconds > 0 ? seconds * 1000 : retryDelay * (0.5 + Math.random());
+            retryDelay = Math.min(retryDelay * 2, MAX_RETRY_DELAY);
+            retryTimer = setTimeout(() => {
+                retryTimer = null;
+                syncQueue();
+            }, delay);
+        }
+
+        // Notatka utworzona offline dostaje od serwera właściwe id
+        async function remapNoteId(tempId, createdNote) {
+            const note = notesById.get(tempId);
+            if (note) {
+                notesById.delete(tempId);
+                note.id = createdNote.id;
+                notesById.set(note.id, note);
+                note.timestamp = createdNote.timestamp;
+                await uncacheNote(tempId);
+                await cacheNote(note);
+            }
+            pendingOps.forEach(op => {
+                if (op.noteId === tempId) {
+                    op.noteId = createdNote.id;
+                    localTx('queue', 'readwrite', store => store.put(op));
+                }
+            });
+            renderNotesList();
+        }
+
+        function setConnectionStatus(online) {
+            const status = document.getElementById('connection-status');
+            if (online) {
+                status.textContent = '🟢 Połączono';
+            } else {
+                status.textContent = `🔴 Offline (w kolejce: ${pendingOps.length})`;
+            }
+        }
+
+        function updateCount() {
+            document.getElementById('notes-count').textContent =
+                `${showArchived ? 'W archiwum' : 'Notatek'}: ${notes.length}`;
+        }
+
         async function loadNotes() {
+            if (Date.now() < backoffUntil) return;
+
+            // Niewysłane zmiany lokalne mają pierwszeństwo przed stanem z serwera
+            await syncQueue();
+            if (pendingOps.length > 0) return;
+
             try {
-                const response = await fetch('/api/notes');
-                notes = await response.json();
+                const archived = showArchived;
+                const response = await apiFetch(archived ? '/api/notes?archived=1' : '/api/notes');
+                if (!response.ok) {
+                    setConnectionStatus(false);
+                    return;
+                }
+                const serverNotes = await response.json();
+                if (pendingOps.length > 0 || archived !== showArchived) return;
+
+                // Lokalna kopia trzyma tylko notatki robocze
+                if (!archived) await cacheServerNotes(notes, serverNotes);
+                setNotes(serverNotes);
+                if (currentNote) {
+                    currentNote = notesById.get(currentNote.id) || currentNote;
+                }
                 renderNotesList();
-                updateStatus(`Załadowano ${notes.length} notatek`);
-                document.getElementById('notes-count').textContent = `Notatek: ${notes.length}`;
+                updateStatus(archived ? `Archiwum: ${notes.length} notatek` : `Załadowano ${notes.length} notatek`);
+                updateCount();
+                setConnectionStatus(true);
             } catch (error) {
-                updateStatus('❌ Błąd ładowania notatek');
-                document.getElementById('connection-status').textContent = '🔴 Błąd połączenia';
+                updateStatus('❌ Błąd ładowania notatek - praca offline');
+                setConnectionStatus(false);
+            }
+        }
+
+        async function toggleArchive() {
+            showArchived = !showArchived;
+            if (showArchived) {
+                workingNotes = notes;
+                setNotes([]);
+            } else {
+                setNotes(workingNotes || []);
+                workingNotes = null;
             }
+            document.getElementById('notes-heading').textContent = showArchived ? '🗄️ Archiwum' : '📋 Notatki';
+            document.getElementById('archive-toggle').textContent = showArchived ? '📋 Notatki' : '🗄️ Archiwum';
+            renderNotesList();
+            updateCount();
+            // Edycja notatki z archiwum przywraca ją na serwerze do notatek roboczych
+            await loadNotes();
+        }
+
+        function setNotes(list) {
+            notes = list;
+            notesById = new Map(notes.map(note => [note.id, note]));
+        }
+
+        function scheduleRenderNotesList() {
+            if (renderScheduled) return;
+            renderScheduled = true;
+            requestAnimationFrame(() => {
+                renderScheduled = false;
+                renderNotesList();
+            });
         }
 
         function renderNotesList() {
             const container = document.getElementById('notes-list');
 
             if (notes.length === 0) {
+                notesSpacer = null;
+                rowsById.clear();
                 container.innerHTML = `
                     <div class="empty-state">
                         <p>Brak notatek</p>
@@ -272,18 +1636,77 @@ HTML_TEMPLATE = '''
                 return;
             }
 
-            container.innerHTML = notes.map(note => `
-                <div class="note-item ${currentNote && currentNote.id === note.id ? 'active' : ''}" 
-                     onclick="selectNote(${note.id})" 
-                     style="border-left-color: ${note.color || '#1976d2'}">
-                    <div class="note-title">${note.title || 'Bez tytułu'}</div>
-                    <div class="note-preview">${note.content.substring(0, 50)}${note.content.length > 50 ? '...' : ''}</div>
-                </div>
-            `).join('');
+            if (!notesSpacer) {
+                container.innerHTML = '';
+                notesSpacer = document.createElement('div');
+                notesSpacer.className = 'notes-spacer';
+                container.appendChild(notesSpacer);
+            }
+            notesSpacer.style.height = `${notes.length * NOTE_ROW_HEIGHT}px`;
+
+            const first = Math.max(0, Math.floor(container.scrollTop / NOTE_ROW_HEIGHT) - OVERSCAN_ROWS);
+            const last = Math.min(notes.length,
+                Math.ceil((container.scrollTop + container.clientHeight) / NOTE_ROW_HEIGHT) + OVERSCAN_ROWS);
+            const visibleNotes = notes.slice(first, last);
+            const visibleIds = new Set(visibleNotes.map(note => note.id));
+
+            // Wiersze, które wypadły z widoku, są używane ponownie dla nowych notatek
+            const spareRows = [];
+            rowsById.forEach((row, noteId) => {
+                if (!visibleIds.has(noteId)) {
+                    spareRows.push(row);
+                    rowsById.delete(noteId);
+                }
+            });
+
+            visibleNotes.forEach((note, offset) => {
+                let row = rowsById.get(note.id);
+                if (!row) {
+                    row = spareRows.pop() || notesSpacer.appendChild(createNoteRow());
+                    rowsById.set(note.id, row);
+                }
+                patchNoteRow(row, note, first + offset);
+            });
+            spareRows.forEach(row => row.remove());
+        }
+
+        function createNoteRow() {
+            const row = document.createElement('div');
+            row.className = 'note-item';
+            row.innerHTML = '<div class="note-title"></div><div class="note-preview"></div>';
+            return row;
+        }
+
+        // Zmienia w wierszu tylko te elementy, które faktycznie się różnią
+        function patchNoteRow(row, note, index) {
+            const content = note.content ?? note.preview ?? '';
+            const title = note.title || 'Bez tytułu';
+            const preview = `${content.substring(0, 50)}${content.length > 50 ? '...' : ''}`;
+            const color = note.color || '#1976d2';
+            const top = `${index * NOTE_ROW_HEIGHT}px`;
+
+            if (row.dataset.id !== String(note.id)) row.dataset.id = note.id;
+            if (row.style.top !== top) row.style.top = top;
+            if (row.dataset.color !== color) {
+                row.dataset.color = color;
+                row.style.borderLeftColor = color;
+            }
+            row.classList.toggle('active', currentNote !== null && currentNote.id === note.id);
+            if (row.firstChild.textContent !== title) row.firstChild.textContent = title;
+            if (row.lastChild.textContent !== preview) row.lastChild.textContent = preview;
         }
 
-        function selectNote(noteId) {
-            currentNote = notes.find(note => note.id === noteId);
+        async function selectNote(noteId) {
+            const note = notesById.get(noteId);
+            if (!note) return;
+
+            // Duże notatki przychodzą na liście jako podgląd - pełną treść pobieramy przy otwarciu
+            if (note.truncated && !(await loadFullNote(note))) {
+                updateStatus('❌ Nie udało się pobrać pełnej treści notatki');
+                return;
+            }
+
+            currentNote = note;
             if (currentNote) {
                 renderEditor();
                 renderNotesList(); // Odśwież listę dla active state
@@ -291,6 +1714,21 @@ HTML_TEMPLATE = '''
             }
         }
 
+        async function loadFullNote(note) {
+            try {
+                const response = await apiFetch(`/api/notes/${note.id}`);
+                if (!response.ok) return false;
+                const fullNote = await response.json();
+                note.content = fullNote.content;
+                delete note.preview;
+                delete note.truncated;
+                if (!showArchived) cacheNote(note);
+                return true;
+            } catch (error) {
+                return false;
+            }
+        }
+
         function renderEditor() {
             const container = document.getElementById('editor-content');
             const backgroundColor = currentNote.color || '#ffffff';
@@ -308,37 +1746,48 @@ HTML_TEMPLATE = '''
             `;
         }
 
+        function syncedStatus(message) {
+            if (syncError) {
+                updateStatus(`❌ Nie zapisano na serwerze: ${syncError}`);
+            } else {
+                updateStatus(pendingOps.length > 0 ? '💾 Zapisano lokalnie - czeka na synchronizację' : message);
+            }
+        }
+
         async function createNote() {
+            if (showArchived) await toggleArchive();
+
+            // Notatka powstaje od razu lokalnie z tymczasowym (ujemnym) id
             const newNote = {
+                id: -Date.now(),
                 title: 'Nowa notatka',
                 content: '',
-                color: '#ffffff'
+                color: '#ffffff',
+                timestamp: new Date().toISOString()
             };
 
-            try {
-                const response = await fetch('/api/notes', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify(newNote)
-                });
-
-                if (response.ok) {
-                    const createdNote = await response.json();
-                    notes.push(createdNote);
-                    currentNote = createdNote;
-                    renderNotesList();
-                    renderEditor();
-                    updateStatus('✅ Nowa notatka utworzona');
-
-                    // Fokus na tytuł
-                    setTimeout(() => {
-                        document.getElementById('note-title').focus();
-                        document.getElementById('note-title').select();
-                    }, 100);
-                }
-            } catch (error) {
-                updateStatus('❌ Błąd tworzenia notatki');
-            }
+            notes.push(newNote);
+            notesById.set(newNote.id, newNote);
+            currentNote = newNote;
+            cacheNote(newNote);
+            enqueueOp({
+                type: 'create',
+                noteId: newNote.id,
+                data: { title: newNote.title, content: newNote.content, color: newNote.color }
+            });
+
+            renderNotesList();
+            renderEditor();
+            updateCount();
+
+            // Fokus na tytuł
+            setTimeout(() => {
+                document.getElementById('note-title').focus();
+                document.getElementById('note-title').select();
+            }, 100);
+
+            await syncQueue();
+            syncedStatus('✅ Nowa notatka utworzona');
         }
 
         async function saveNote() {
@@ -356,22 +1805,14 @@ HTML_TEMPLATE = '''
                 color: currentNote.color || '#ffffff'
             };
 
-            try {
-                const response = await fetch(`/api/notes/${currentNote.id}`, {
-                    method: 'PUT',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify(updatedNote)
-                });
+            currentNote.title = updatedNote.title;
+            currentNote.content = updatedNote.content;
+            cacheNote(currentNote);
+            enqueueOp({ type: 'update', noteId: currentNote.id, data: updatedNote });
+            renderNotesList();
 
-                if (response.ok) {
-                    currentNote.title = updatedNote.title;
-                    currentNote.content = updatedNote.content;
-                    renderNotesList();
-                    updateStatus('✅ Notatka zapisana');
-                }
-            } catch (error) {
-                updateStatus('❌ Błąd zapisywania');
-            }
+            await syncQueue();
+            syncedStatus('✅ Notatka zapisana');
         }
 
         async function deleteNote() {
@@ -381,28 +1822,23 @@ HTML_TEMPLATE = '''
             }
 
             if (confirm(`Czy na pewno chcesz usunąć notatkę "${currentNote.title}"?`)) {
-                try {
-                    const response = await fetch(`/api/notes/${currentNote.id}`, {
-                        method: 'DELETE'
-                    });
-
-                    if (response.ok) {
-                        notes = notes.filter(note => note.id !== currentNote.id);
-                        currentNote = null;
-                        renderNotesList();
-
-                        document.getElementById('editor-content').innerHTML = `
-                            <div class="empty-state">
-                                <p>Wybierz notatkę do edycji</p>
-                                <p>lub utwórz nową</p>
-                            </div>
-                        `;
-
-                        updateStatus('✅ Notatka usunięta');
-                    }
-                } catch (error) {
-                    updateStatus('❌ Błąd usuwania');
-                }
+                const noteId = currentNote.id;
+                setNotes(notes.filter(note => note.id !== noteId));
+                currentNote = null;
+                uncacheNote(noteId);
+                enqueueOp({ type: 'delete', noteId: noteId });
+                renderNotesList();
+                updateCount();
+
+                document.getElementById('editor-content').innerHTML = `
+                    <div class="empty-state">
+                        <p>Wybierz notatkę do edycji</p>
+                        <p>lub utwórz nową</p>
+                    </div>
+                `;
+
+                await syncQueue();
+                syncedStatus('✅ Notatka usunięta');
             }
         }
 
@@ -443,6 +1879,10 @@ HTML_TEMPLATE = '''
 '''
 
 
+# Replika przyjmuje tylko odczyty notatek i nie udostępnia dziennika zmian
+app.before_request(reject_writes_on_replica)
+
+
 @app.route('/')
 def home():
     """Główna strona aplikacji"""
@@ -451,67 +1891,347 @@ def home():
 
 @app.route('/api/notes', methods=['GET'])
 def get_notes():
-    """API: Pobiera wszystkie notatki"""
-    return jsonify(load_notes())
+    """API: Pobiera notatki (duże - tylko z podglądem)
+
+    Opcjonalnie ?color=, ?modified_after=, ?modified_before= i ?sort=modified|created|title;
+    ?archived=1 - notatki z archiwum zamiast magazynu roboczego
+    """
+    try:
+        color, after, before, sort = parse_list_query(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Błędne parametry listy - {e}'}), 400
+
+    if request.args.get('archived') == '1':
+        return jsonify([{**note.summary(), 'archived': True}
+                        for note in list_archived(NOTES_FILE, color, after, before, sort)])
+
+    # Gotowe bajty odpowiedzi z cache - unieważniane przez mark_dirty() po każdej zmianie
+    return cached_list_response(NOTES_FILE, (color, after, before, sort),
+                                lambda: [note.summary() for note in query_notes(color, after, before, sort)])
+
+
+@app.route('/api/notes/suggest', methods=['GET'])
+def suggest_titles():
+    """API: Podpowiedzi tytułów - ?prefix= (bez wielkości liter i polskich znaków), opcjonalnie ?limit="""
+    try:
+        prefix, limit = parse_suggest_query(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Błędne parametry podpowiedzi - {e}'}), 400
+
+    matches = [(suggest_key(note.title), note.id, {'id': note.id, 'title': note.title, 'color': note.color})
+               for note in suggest_notes(prefix, limit)]
+    hot_ids = {note_id for _, note_id, _ in matches}
+    if prefix:
+        matches += [(key, note_id, {'id': note_id, 'title': title, 'color': color, 'archived': True})
+                    for key, note_id, title, color in suggest_archived(NOTES_FILE, prefix, limit)
+                    if note_id not in hot_ids]
+    matches.sort(key=lambda match: match[:2])
+    return jsonify([match[2] for match in matches[:limit]])
+
+
+@app.route('/api/notes/<int:note_id>', methods=['GET'])
+def get_note(note_id):
+    """API: Pobiera jedną notatkę z pełną treścią"""
+    with _notes_lock:
+        note = get_note_index()['by_id'].get(note_id)
+    if note is not None:
+        return jsonify(note.full())
+
+    note = get_archived(NOTES_FILE, note_id)
+    if note is not None:
+        return jsonify({**note.full(), 'archived': True})
+
+    return jsonify({'error': 'Notatka nie znaleziona'}), 404
 
 
 @app.route('/api/notes', methods=['POST'])
 def add_note():
     """API: Dodaje nową notatkę"""
     data = request.json
-    notes = load_notes()
 
-    max_id = max([note.get('id', 0) for note in notes], default=0)
+    with _notes_lock:
+        content = text_value(data.get('content', ''))
+        note = Note.create(next_note_id(), data.get('title', 'Nowa notatka'), content,
+                           data.get('color', '#ffffff'), datetime.now().isoformat())
+        response = jsonify(note.full(content))
 
-    note = {
-        'id': max_id + 1,
-        'title': data.get('title', 'Nowa notatka'),
-        'content': data.get('content', ''),
-        'timestamp': datetime.now().isoformat(),
-        'color': data.get('color', '#ffffff')
-    }
+        get_notes_store()[note.id] = note
+        index_add(note)
+        log_change('upsert', note.id)
 
-    notes.append(note)
-    save_notes(notes)
-    return jsonify(note), 201
+    mark_dirty()
+    return response, 201
 
 
 @app.route('/api/notes/<int:note_id>', methods=['PUT'])
 def update_note(note_id):
     """API: Aktualizuje notatkę"""
     data = request.json
-    notes = load_notes()
 
-    for note in notes:
-        if note['id'] == note_id:
-            note['title'] = data.get('title', note['title'])
-            note['content'] = data.get('content', note['content'])
-            note['color'] = data.get('color', note['color'])
-            note['timestamp'] = datetime.now().isoformat()
-            save_notes(notes)
-            return jsonify(note)
+    changes = {field: data[field] for field in ('title', 'content', 'color') if field in data}
 
-    return jsonify({'error': 'Notatka nie znaleziona'}), 404
+    # Zmiana archiwalnej notatki przywraca ją najpierw do magazynu roboczego
+    with _notes_lock:
+        archived = note_id not in get_note_index()['by_id']
+    if archived:
+        restore_archived(note_id)
+
+    with _notes_lock:
+        note = apply_note_update(note_id, changes)
+        if note is None:
+            return jsonify({'error': 'Notatka nie znaleziona'}), 404
+        response = jsonify(note.full(text_value(data.get('content'))))
+
+    mark_dirty()
+    return response
 
 
 @app.route('/api/notes/<int:note_id>', methods=['DELETE'])
 def delete_note(note_id):
     """API: Usuwa notatkę"""
-    notes = load_notes()
-    original_count = len(notes)
-    notes = [note for note in notes if note['id'] != note_id]
+    with _notes_lock:
+        note = get_notes_store().pop(note_id, None)
+        deleted = note is not None
+        if deleted:
+            index_remove(note)
+            drop_revisions(note_id)
+            log_change('delete', note_id)
+
+    if not deleted and remove_archived(NOTES_FILE, [note_id]):
+        with _notes_lock:
+            log_change('delete', note_id)
+        return jsonify({'message': 'Notatka usunięta'})
 
-    if len(notes) < original_count:
-        save_notes(notes)
+    if deleted:
+        mark_dirty()
         return jsonify({'message': 'Notatka usunięta'})
     else:
         return jsonify({'error': 'Notatka nie znaleziona'}), 404
 
 
+@app.route('/api/notes/<int:note_id>/revisions', methods=['GET'])
+def get_revisions(note_id):
+    """API: Historia wersji notatki (od najnowszej, bez treści)"""
+    with _notes_lock:
+        if note_id not in get_note_index()['by_id']:
+            return jsonify({'error': 'Notatka nie znaleziona'}), 404
+        history = get_revisions_store().get(note_id, [])
+
+    return jsonify([revision.summary() for revision in reversed(history)])
+
+
+@app.route('/api/notes/<int:note_id>/revisions/<int:rev>', methods=['GET'])
+def get_revision(note_id, rev):
+    """API: Jedna wersja notatki z pełną treścią"""
+    with _notes_lock:
+        chain = revision_chain(get_revisions_store().get(note_id, []), rev)
+
+    if chain is None:
+        return jsonify({'error': 'Wersja nie znaleziona'}), 404
+
+    return jsonify(chain[-1].full(revision_content(chain)))
+
+
+@app.route('/api/notes/<int:note_id>/revisions/<int:rev>/restore', methods=['POST'])
+def restore_revision(note_id, rev):
+    """API: Przywraca wersję notatki (bieżący stan trafia do historii, więc można to cofnąć)"""
+    with _notes_lock:
+        chain = revision_chain(get_revisions_store().get(note_id, []), rev)
+        if chain is None:
+            return jsonify({'error': 'Wersja nie znaleziona'}), 404
+
+        revision = chain[-1]
+        content = revision_content(chain)
+        note = apply_note_update(note_id, {'title': revision.title, 'content': content, 'color': revision.color},
+                                 force_revision=True)
+        if note is None:
+            return jsonify({'error': 'Notatka nie znaleziona'}), 404
+
+    mark_dirty()
+    return jsonify(note.full(content))
+
+
+@app.route('/api/export', methods=['GET'])
+def export_notes():
+    """API: Eksportuje wszystkie notatki (także z archiwum) jako strumień NDJSON"""
+    snapshot = snapshot_notes()
+
+    def generate():
+        chunk = []
+        hot_ids = {note.id for note in snapshot}
+        archived = (note for note in iter_archived(NOTES_FILE) if note.id not in hot_ids)
+        for note in chain(snapshot, archived):
+            chunk.append(json.dumps(note.full(), ensure_ascii=False))
+            if len(chunk) >= EXPORT_CHUNK_SIZE:
+                yield '\n'.join(chunk) + '\n'
+                chunk = []
+        if chunk:
+            yield '\n'.join(chunk) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': 'attachment; filename=notes.ndjson'})
+
+
+@app.route('/api/import', methods=['POST'])
+def import_notes():
+    """API: Importuje notatki ze strumienia NDJSON (notatki o tym samym id są zastępowane)"""
+    imported = []
+    try:
+        for data in read_ndjson(io.BufferedReader(request.stream, 1 << 16)):
+            imported.append(Note.create(data.get('id'), data.get('title', 'Nowa notatka'), data.get('content', ''),
+                                        data.get('color', '#ffffff'),
+                                        data.get('timestamp') or datetime.now().isoformat()))
+    except ValueError as e:
+        return jsonify({'error': f'Błędny plik importu - {e}'}), 400
+
+    with _notes_lock:
+        notes = get_notes_store()
+        for note in imported:
+            if not isinstance(note.id, int):
+                note.id = next_note_id()
+            else:
+                reserve_note_id(note.id)
+            # Notatka o istniejącym id zostaje zastąpiona na swoim miejscu
+            notes[note.id] = note
+
+        # Import nie trafia do dziennika zmiana po zmianie - repliki pobiorą pełną kopię
+        if imported:
+            invalidate_note_index()
+            log_change('reset')
+
+    # Jeden zbiorczy zapis na dysk dla całego importu; zaimportowane zastępują kopie w archiwum
+    if imported:
+        mark_dirty()
+        remove_archived(NOTES_FILE, [note.id for note in imported])
+    return jsonify({'imported': len(imported)})
+
+
+@app.route('/api/replication/changes', methods=['GET'])
+def get_changes():
+    """API (replikacja): Zmiany z dziennika o numerach większych niż ?since="""
+    since = request.args.get('since', 0, type=int)
+    epoch = request.args.get('epoch', '')
+    limit = min(request.args.get('limit', REPLICATION_BATCH, type=int), 10 * REPLICATION_BATCH)
+
+    with _notes_lock:
+        oldest = _changes[0][0] if _changes else _change_seq + 1
+        # Inna epoka, luka w przyciętym dzienniku lub replika "z przyszłości" - potrzebna pełna kopia
+        if epoch != _epoch or since > _change_seq or since < oldest - 1:
+            return jsonify({'epoch': _epoch, 'seq': _change_seq, 'reset': True, 'changes': []})
+        latest = _change_seq
+        by_id = get_note_index()['by_id']
+        changes = []
+        for seq, op, note_id, created in islice(_changes, since - oldest + 1, since - oldest + 1 + limit):
+            note = by_id.get(note_id) if op == 'upsert' else None
+            changes.append({'seq': seq, 'op': op, 'id': note_id, 'note': note, 'created': created})
+
+    # Zmiana niesie bieżącą wersję notatki (kolejne zmiany tej samej notatki dają to samo);
+    # notatka przeniesiona od tamtej pory do archiwum - z archiwum, usunięta - jako 'delete'
+    for change in changes:
+        if change['op'] == 'upsert' and change['note'] is None:
+            archived = get_archived(NOTES_FILE, change['id'])
+            if archived is None:
+                change['op'] = 'delete'
+            else:
+                change['note'] = hot_note(archived)
+        if change['note'] is not None:
+            change['note'] = change['note'].to_json()
+    return jsonify({'epoch': _epoch, 'seq': latest, 'reset': False, 'changes': changes})
+
+
+@app.route('/api/replication/snapshot', methods=['GET'])
+def get_replication_snapshot():
+    """API (replikacja): Pełna kopia notatek (NDJSON) z numerem zmiany, której odpowiada"""
+    with _notes_lock:
+        snapshot = list(get_notes_store().values())
+        seq = _change_seq
+
+    def generate():
+        chunk = []
+        # Replika dostaje też archiwum - sama go nie prowadzi
+        hot_ids = {note.id for note in snapshot}
+        archived = (hot_note(note) for note in iter_archived(NOTES_FILE) if note.id not in hot_ids)
+        for note in chain(snapshot, archived):
+            chunk.append(json.dumps(note.to_json(), ensure_ascii=False))
+            if len(chunk) >= EXPORT_CHUNK_SIZE:
+                yield '\n'.join(chunk) + '\n'
+                chunk = []
+        if chunk:
+            yield '\n'.join(chunk) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson',
+                    headers={'X-Replication-Epoch': _epoch, 'X-Replication-Seq': str(seq)})
+
+
+@app.route('/api/replication/status', methods=['GET'])
+def get_replication_status():
+    """API: Stan replikacji (rola, opóźnienie repliki)"""
+    return jsonify(replication_stats(_replication_stats))
+
+
+@app.route('/api/admin/backup', methods=['POST'])
+def create_backup():
+    """API (admin): Tworzy migawkę notatek"""
+    denied = admin_denied()
+    if denied:
+        return denied
+
+    target = backup_notes()
+    if target is None:
+        return jsonify({'error': 'Błąd kopii zapasowej'}), 500
+
+    return jsonify({'backup': target, 'duration_ms': _backup_stats['last_backup_duration_ms']}), 201
+
+
+@app.route('/api/admin/archive', methods=['POST'])
+def run_archive():
+    """API (admin): Od razu przenosi do archiwum notatki nieruszane dłużej niż ARCHIVE_AFTER"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    if REPLICA_OF:
+        return jsonify({'error': 'Replika nie prowadzi archiwum'}), 409
+
+    return jsonify({'archived': archive_stale_notes()})
+
+
+@app.route('/api/admin/backups', methods=['GET'])
+def get_backups():
+    """API (admin): Lista migawek notatek"""
+    denied = admin_denied()
+    if denied:
+        return denied
+
+    backups = []
+    for name in list_backups():
+        path = os.path.join(BACKUP_DIR, name)
+        backups.append({'file': name, 'size': os.path.getsize(path)})
+    return jsonify(backups)
+
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """API: Metryki serwera (zapis w tle, migawki)"""
+    return jsonify({
+        'flush': flush_stats(),
+        'backups': dict(_backup_stats),
+        'replication': replication_stats(_replication_stats),
+        'admission': admission_stats(),
+        'list_cache': cache_stats(),
+        'archive': archive_stats(NOTES_FILE),
+    })
+
+
 if __name__ == '__main__':
     print("🚀 KEEP WEB SERVER")
-    print("📍 Lokalnie: http://localhost:5000")
-    print("🌐 W sieci: http://192.168.x.x:5000")
+    print(f"📍 Lokalnie: http://localhost:{PORT}")
+    print(f"🌐 W sieci: http://192.168.x.x:{PORT}")
+    if REPLICA_OF:
+        print(f"🔁 Replika tylko do odczytu: {REPLICA_OF}")
     print("⚡ Otwórz w przeglądarce!")
 
-    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
\ No newline at end of file
+    install_signal_handlers()
+    start_backup_scheduler()
+    start_replication()
+    start_archiver()
+    app.run(host='0.0.0.0', port=PORT, debug=False, threaded=True)
\ No newline at end of file
@@ -1,37 +1,773 @@
-from flask import Flask, render_template_string, request, jsonify
+from flask import Flask, Response, g, render_template_string, request, jsonify
 from flask_cors import CORS
 import sqlite3
+import re
 import json
+import shutil
+import tempfile
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from contextlib import closing, contextmanager
 from datetime import datetime
+from itertools import chain
 import os
 
+from admission import admin_denied, admission_stats, install_admission_control
+from archive import (ARCHIVE, ARCHIVE_AFTER, ARCHIVE_BATCH, ARCHIVE_INTERVAL, archive_path, archive_stats, get_archived,
+                     hot_note, iter_archived, list_archived, record_archive_pass, record_restore, remove_archived,
+                     store_archived, suggest_archived)
+from replication import (CHANGELOG_KEEP, REPLICA_OF, REPLICATION_BATCH, REPLICATION_POLL_INTERVAL,
+                         fetch_from_primary, reject_writes_on_replica, replication_stats)
+from response_cache import cache_stats, cached_list_response, invalidate_lists
+from models import (Note, NOTE_COLUMNS, NOTE_SUMMARY_COLUMNS, NOTE_VALUES, Revision, REVISION_COLUMNS,
+                    REVISION_KEYFRAME_INTERVAL, note_order, pack_text, parse_list_query, parse_suggest_query,
+                    prefix_upper_bound, read_ndjson, revision_content, suggest_key, text_value,
+                    timestamp_key)
+
 app = Flask(__name__)
 CORS(app)
-
-DATABASE = 'notes.db'
-
-def init_db():
+install_admission_control(app)
+
+DATABASE = os.environ.get('KEEP_DATABASE', 'notes.db')
+PORT = int(os.environ.get('KEEP_PORT', 5000))
+
+EXPORT_CHUNK_SIZE = 500  # notatek w jednym fragmencie odpowiedzi /api/export
+IMPORT_BATCH_SIZE = 10000  # wierszy w jednym executemany podczas importu
+IMPORT_SPOOL_MEMORY = 8 << 20  # bajtów importu buforowanych w pamięci, większe - w pliku tymczasowym
+
+# Historia wersji (tabela revisions): przy każdej zmianie poprzedni stan notatki
+# trafia do historii jako delta względem poprzedniej wersji, co kilka wersji w całości
+REVISION_MIN_INTERVAL = 30  # sekundy - kolejne autozapisy w tym oknie nie tworzą nowych wersji
+REVISIONS_KEEP = 50  # ile najnowszych wersji zachować dla notatki
+REVISIONS_MAX_AGE = 30 * 24 * 3600  # starsze wersje są usuwane przy kolejnej zmianie notatki
+
+# Tryb wielu notatników: każdy notatnik (np. użytkownika) ma własny plik SQLite,
+# wybierany nagłówkiem X-Notebook lub parametrem ?notebook=
+MULTI_NOTEBOOK = False
+NOTEBOOKS_DIR = 'notebooks'
+DEFAULT_NOTEBOOK = 'default'
+MAX_OPEN_NOTEBOOKS = 256  # limit otwartych połączeń (i deskryptorów plików)
+NOTEBOOK_IDLE_TIMEOUT = 300  # po tylu sekundach bez użycia połączenie jest zamykane
+NOTEBOOK_NAME_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+_notebooks = OrderedDict()  # nazwa -> NotebookHandle, od najdawniej używanego
+_notebooks_lock = threading.Lock()
+_notebook_janitor = None
+_notebook_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+# Kopie zapasowe na gorąco (VACUUM INTO) - harmonogram w tle i ręcznie przez
+# POST /api/admin/backup. Kopia to jedna transakcja odczytu: w trybie WAL zapisy
+# idą w tym czasie dalej, a kopia widzi stan z chwili jej rozpoczęcia
+BACKUP_DIR = 'backups'
+BACKUP_INTERVAL = 3600  # co ile sekund robić kopię w tle (0 - wyłączone)
+BACKUP_KEEP = 24  # ile najnowszych kopii każdej bazy zachować
+BACKUP_BUSY_TIMEOUT = 5  # sekundy czekania na zajętą bazę w jednej próbie
+BACKUP_RETRIES = 2  # ile razy ponowić kopię, gdy baza dalej jest zajęta
+
+# Replikacja (replication.py): każda zmiana notatki trafia do dziennika (tabela changes)
+# w tej samej transakcji; dziennik trzyma tylko id, a treść dołącza get_changes (LEFT JOIN notes)
+CHANGE_NOTE_COLUMNS = ', '.join('notes.' + column for column in NOTE_COLUMNS.split(', '))
+
+_replication_thread = None
+_replication_stats = {
+    'applied_seq': 0,
+    'primary_seq': 0,
+    'resyncs': 0,
+    'errors': 0,
+    'last_error': None,
+    'last_sync_at': None,
+    'caught_up_at': None,
+}
+
+# Konserwacja w tle: PRAGMA optimize, incremental vacuum i checkpointy WAL,
+# uruchamiane tylko w okresach bez zapisów i z limitem czasu na przebieg
+MAINTENANCE_INTERVAL = 60  # sekundy między przebiegami
+MAINTENANCE_IDLE_AFTER = 5  # ile sekund bez zapisów uznajemy za bezczynność
+MAINTENANCE_BUDGET = 0.2  # maksymalny czas jednego przebiegu (sekundy)
+MAINTENANCE_VACUUM_PAGES = 128  # stron zwalnianych w jednym kroku incremental_vacuum
+WAL_TRUNCATE_PAGES = 4096  # większy WAL jest po checkpoincie przycinany (TRUNCATE)
+
+_last_write_at = 0.0
+_maintenance_thread = None
+_maintenance_cursor = ''  # ostatnia w pełni obsłużona baza - następny przebieg zaczyna za nią
+_maintenance_stats = {
+    'passes': 0,
+    'skipped_busy': 0,
+    'pages_vacuumed': 0,
+    'checkpoints': 0,
+    'wal_truncates': 0,
+    'last_pass_at': None,
+    'last_pass_duration_ms': 0.0,
+}
+
+_archiver_thread = None
+
+_backup_lock = threading.Lock()  # jedna kopia naraz
+_backup_thread = None
+_backup_stats = {
+    'backups': 0,
+    'errors': 0,
+    'last_backup_at': None,
+    'last_backup_duration_ms': 0.0,
+}
+
+def init_db(database=None):
     """Inicjalizuje bazę danych SQLite"""
-    conn = sqlite3.connect(DATABASE)
+    conn = sqlite3.connect(database or DATABASE)
     cursor = conn.cursor()
+
+    # auto_vacuum=INCREMENTAL musi być ustawione przed utworzeniem tabel;
+    # starsze bazy są jednorazowo przebudowywane przez VACUUM
+    if cursor.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        if cursor.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()[0]:
+            cursor.execute('VACUUM')
+    cursor.execute('PRAGMA journal_mode = WAL')
+
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS notes (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             title TEXT NOT NULL,
             content TEXT NOT NULL,
             color TEXT DEFAULT '#ffffff',
-            timestamp TEXT NOT NULL
+            timestamp TEXT NOT NULL,
+            content_z BLOB,
+            preview TEXT,
+            modified REAL,
+            title_key TEXT
         )
     ''')
+
+    # Migracja starszych baz bez kolumn na skompresowaną treść
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(notes)')}
+    if 'content_z' not in columns:
+        cursor.execute('ALTER TABLE notes ADD COLUMN content_z BLOB')
+    if 'preview' not in columns:
+        cursor.execute('ALTER TABLE notes ADD COLUMN preview TEXT')
+    if 'modified' not in columns:
+        cursor.execute('ALTER TABLE notes ADD COLUMN modified REAL')
+        cursor.executemany(
+            'UPDATE notes SET modified = ? WHERE id = ?',
+            [(timestamp_key(timestamp), note_id) for note_id, timestamp in cursor.execute('SELECT id, timestamp FROM notes')]
+        )
+    if 'title_key' not in columns:
+        cursor.execute('ALTER TABLE notes ADD COLUMN title_key TEXT')
+        cursor.executemany(
+            'UPDATE notes SET title_key = ? WHERE id = ?',
+            [(suggest_key(title), note_id) for note_id, title in cursor.execute('SELECT id, title FROM notes')]
+        )
+
+    # Indeksy pod filtry i sortowanie listy (kolor + czas modyfikacji, czas, tytuł)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notes_color_modified ON notes (color, modified)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notes_modified ON notes (modified)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notes_title ON notes (title COLLATE NOCASE)')
+    # Podpowiedzi tytułów: zakres title_key >= prefiks AND < prefix_upper_bound(prefiks)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notes_title_key ON notes (title_key, id)')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS revisions (
+            note_id INTEGER NOT NULL,
+            rev INTEGER NOT NULL,
+            created REAL NOT NULL,
+            title TEXT,
+            color TEXT,
+            timestamp TEXT,
+            keyframe INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (note_id, rev)
+        )
+    ''')
+
+    # Dziennik zmian dla replik; AUTOINCREMENT - numery nie wracają po przycięciu dziennika
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            op TEXT NOT NULL,
+            note_id INTEGER,
+            note TEXT,  -- nieużywana (dawniej pełna notatka); get_changes czyta bieżący wiersz notes
+            created REAL NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS replication_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
+    # Epoka identyfikuje dziennik - replika innej epoki musi pobrać pełną kopię
+    cursor.execute("INSERT OR IGNORE INTO replication_meta (key, value) VALUES ('epoch', ?)", (uuid.uuid4().hex,))
+
     conn.commit()
     conn.close()
 
-def get_db_connection():
+def get_db_connection(database=None):
     """Połączenie z bazą danych"""
-    conn = sqlite3.connect(DATABASE)
+    conn = sqlite3.connect(database or DATABASE)
     conn.row_factory = sqlite3.Row  # Pozwala na dostęp do kolumn przez nazwę
     return conn
 
+
+class NotebookHandle:
+    """Otwarte połączenie z plikiem jednego notatnika"""
+    __slots__ = ('name', 'conn', 'lock', 'users', 'last_used')
+
+    def __init__(self, name, conn):
+        self.name = name
+        self.conn = conn
+        self.lock = threading.Lock()  # zapisy serializowane osobno dla każdego notatnika
+        self.users = 0
+        self.last_used = time.monotonic()
+
+
+def notebook_path(name):
+    return os.path.join(NOTEBOOKS_DIR, f'{name}.db')
+
+
+def current_database():
+    """Ścieżka bazy dla bieżącego żądania"""
+    return notebook_path(g.notebook) if MULTI_NOTEBOOK else DATABASE
+
+
+def acquire_notebook(name):
+    """Zwraca połączenie z notatnikiem z puli LRU (otwiera je przy pierwszym użyciu)"""
+    with _notebooks_lock:
+        handle = _notebooks.get(name)
+        if handle is not None:
+            _notebooks.move_to_end(name)
+            _notebook_stats['hits'] += 1
+        else:
+            _notebook_stats['misses'] += 1
+            os.makedirs(NOTEBOOKS_DIR, exist_ok=True)
+            init_db(notebook_path(name))
+            conn = sqlite3.connect(notebook_path(name), check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            handle = NotebookHandle(name, conn)
+            _notebooks[name] = handle
+            _evict_notebooks()
+        handle.users += 1
+
+    start_notebook_janitor()
+    return handle
+
+
+def release_notebook(handle):
+    with _notebooks_lock:
+        handle.users -= 1
+        handle.last_used = time.monotonic()
+
+
+def _evict_notebooks():
+    """Zamyka nieużywane połączenia: bezczynne oraz ponad limit (wywoływać pod _notebooks_lock)"""
+    now = time.monotonic()
+    for name, handle in list(_notebooks.items()):
+        over_limit = len(_notebooks) > MAX_OPEN_NOTEBOOKS
+        if not over_limit and now - handle.last_used < NOTEBOOK_IDLE_TIMEOUT:
+            break
+        if handle.users:
+            continue
+        del _notebooks[name]
+        handle.conn.close()
+        _notebook_stats['evictions'] += 1
+
+
+def _notebook_janitor_loop():
+    while True:
+        time.sleep(min(NOTEBOOK_IDLE_TIMEOUT, 60))
+        with _notebooks_lock:
+            _evict_notebooks()
+
+
+def start_notebook_janitor():
+    """Uruchamia wątek zamykający bezczynne notatniki (tylko raz)"""
+    global _notebook_janitor
+    with _notebooks_lock:
+        if _notebook_janitor is None:
+            _notebook_janitor = threading.Thread(target=_notebook_janitor_loop, name='notebook-janitor', daemon=True)
+            _notebook_janitor.start()
+
+
+def backup_name(database):
+    return os.path.splitext(os.path.basename(database))[0]
+
+
+def backup_database(database):
+    """Kopiuje bazę przez VACUUM INTO, nie blokując zapisów; zwraca ścieżkę kopii"""
+    name = backup_name(database)
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    target = os.path.join(BACKUP_DIR, f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.db")
+    tmp_target = target + '.tmp'
+
+    with _backup_lock:
+        started = time.monotonic()
+        try:
+            for attempt in range(BACKUP_RETRIES + 1):
+                try:
+                    with closing(sqlite3.connect(database, timeout=BACKUP_BUSY_TIMEOUT)) as source:
+                        source.execute('VACUUM INTO ?', (tmp_target,))
+                    break
+                except sqlite3.OperationalError as e:
+                    # Zajęta baza (np. checkpoint) - kilka prób, potem błąd zamiast czekania bez końca
+                    if os.path.exists(tmp_target):
+                        os.remove(tmp_target)
+                    if attempt == BACKUP_RETRIES or 'locked' not in str(e):
+                        raise
+            os.replace(tmp_target, target)
+        except (OSError, sqlite3.Error):
+            _backup_stats['errors'] += 1
+            if os.path.exists(tmp_target):
+                os.remove(tmp_target)
+            raise
+
+        rotate_backups(name)
+        _backup_stats['backups'] += 1
+        _backup_stats['last_backup_at'] = datetime.now().isoformat()
+        _backup_stats['last_backup_duration_ms'] = (time.monotonic() - started) * 1000
+
+    return target
+
+
+def backup_with_archive(database):
+    """Kopia bazy oraz - jeśli istnieje - jej archiwum (osobny plik, osobna rotacja); zwraca ścieżkę kopii bazy"""
+    target = backup_database(database)
+    if os.path.exists(archive_path(database)):
+        backup_database(archive_path(database))
+    return target
+
+
+def list_backups(name):
+    """Kopie danej bazy, od najstarszej"""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    pattern = re.compile(rf'^{re.escape(name)}-\d{{8}}-\d{{6}}-\d{{6}}\.db$')
+    return sorted(f for f in os.listdir(BACKUP_DIR) if pattern.match(f))
+
+
+def rotate_backups(name):
+    """Usuwa najstarsze kopie ponad BACKUP_KEEP"""
+    backups = list_backups(name)
+    for old in backups[:max(0, len(backups) - BACKUP_KEEP)]:
+        os.remove(os.path.join(BACKUP_DIR, old))
+
+
+def all_databases():
+    """Wszystkie bazy do objęcia kopią w tle"""
+    if MULTI_NOTEBOOK:
+        if not os.path.isdir(NOTEBOOKS_DIR):
+            return []
+        return [os.path.join(NOTEBOOKS_DIR, f) for f in sorted(os.listdir(NOTEBOOKS_DIR)) if f.endswith('.db')]
+    return [DATABASE] if os.path.exists(DATABASE) else []
+
+
+def _backup_loop():
+    while True:
+        time.sleep(BACKUP_INTERVAL)
+        for database in all_databases():
+            try:
+                backup_with_archive(database)
+            except (OSError, sqlite3.Error) as e:
+                print(f"Błąd kopii zapasowej {database}: {e}")
+
+
+def start_backup_scheduler():
+    """Uruchamia wątek kopii zapasowych w tle (tylko raz)"""
+    global _backup_thread
+    if BACKUP_INTERVAL > 0 and _backup_thread is None:
+        _backup_thread = threading.Thread(target=_backup_loop, name='backup-scheduler', daemon=True)
+        _backup_thread.start()
+
+
+@contextmanager
+def db_connection():
+    """Połączenie z bazą bieżącego żądania (w trybie wielu notatników - z puli)"""
+    if not MULTI_NOTEBOOK:
+        conn = get_db_connection()
+        try:
+            yield conn
+        finally:
+            conn.close()
+        return
+
+    handle = acquire_notebook(g.notebook)
+    try:
+        with handle.lock:
+            try:
+                yield handle.conn
+            finally:
+                # Niezatwierdzone zmiany nie mogą przejść do następnego żądania
+                if handle.conn.in_transaction:
+                    handle.conn.rollback()
+    finally:
+        release_notebook(handle)
+
+
+def get_meta(conn, key, default=None):
+    row = conn.execute('SELECT value FROM replication_meta WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else default
+
+
+def set_meta(conn, key, value):
+    conn.execute('INSERT OR REPLACE INTO replication_meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+
+def log_change(conn, op, note_id=None):
+    """Dopisuje zmianę do dziennika replikacji - wywoływać w transakcji samej zmiany.
+
+    op: 'upsert' (dodanie/zmiana), 'delete' albo 'reset' (np. po imporcie -
+    repliki pobierają wtedy pełną kopię zamiast pojedynczych zmian).
+    Dziennik nie trzyma notatek - get_changes wysyła ich bieżącą wersję.
+    """
+    cursor = conn.execute(
+        'INSERT INTO changes (op, note_id, created) VALUES (?, ?, ?)',
+        (op, note_id, time.time())
+    )
+    conn.execute('DELETE FROM changes WHERE seq <= ?', (cursor.lastrowid - CHANGELOG_KEEP,))
+
+
+def load_revision_chain(conn, note_id, rev):
+    """Wersje od najbliższego keyframe do rev (rosnąco) albo None, jeśli wersji nie ma"""
+    keyframe = conn.execute(
+        'SELECT MAX(rev) FROM revisions WHERE note_id = ? AND keyframe = 1 AND rev <= ?', (note_id, rev)
+    ).fetchone()[0]
+    if keyframe is None:
+        return None
+    chain = [Revision.from_row(row) for row in conn.execute(
+        f'SELECT {REVISION_COLUMNS} FROM revisions WHERE note_id = ? AND rev BETWEEN ? AND ? ORDER BY rev',
+        (note_id, keyframe, rev)
+    )]
+    if not chain or chain[-1].rev != rev:
+        return None
+    return chain
+
+
+def record_revision(conn, note_id, force=False):
+    """Zapisuje bieżący stan notatki w historii - wywoływać w transakcji zmiany, przed nadpisaniem.
+
+    force - zapisz także w serii autozapisów (np. przed przywróceniem wersji)
+    """
+    row = conn.execute(f'SELECT {NOTE_COLUMNS} FROM notes WHERE id = ?', (note_id,)).fetchone()
+    if row is None:
+        return
+    note = Note.from_row(row)
+    content = note.get_content()
+    now = time.time()
+
+    base = None
+    last_rev = conn.execute('SELECT MAX(rev) FROM revisions WHERE note_id = ?', (note_id,)).fetchone()[0]
+    chain = load_revision_chain(conn, note_id, last_rev) if last_rev is not None else None
+    if chain:
+        last = chain[-1]
+        # Seria autozapisów - stan sprzed jej początku już jest w historii
+        if not force and now - last.created < REVISION_MIN_INTERVAL:
+            return
+        base = revision_content(chain)
+        if base == content and last.title == note.title and last.color == note.color:
+            return
+        if len(chain) >= REVISION_KEYFRAME_INTERVAL:
+            base = None
+
+    revision = Revision.capture((last_rev or 0) + 1, note, now, content, base)
+    conn.execute(
+        f'INSERT INTO revisions (note_id, {REVISION_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        (note_id,) + revision.to_row()
+    )
+    trim_revisions(conn, note_id, now)
+
+
+def trim_revisions(conn, note_id, now):
+    """Usuwa wersje ponad REVISIONS_KEEP i starsze niż REVISIONS_MAX_AGE"""
+    oldest, newest = conn.execute(
+        'SELECT MIN(rev), MAX(rev) FROM revisions WHERE note_id = ?', (note_id,)
+    ).fetchone()
+    if oldest is None:
+        return
+    young = conn.execute(
+        'SELECT MIN(rev) FROM revisions WHERE note_id = ? AND created >= ?', (note_id, now - REVISIONS_MAX_AGE)
+    ).fetchone()[0]
+    first = max(newest - REVISIONS_KEEP + 1, young if young is not None else newest)
+    if first <= oldest:
+        return
+
+    # Najstarsza zachowana wersja musi dać się odtworzyć bez usuwanych - zapisz ją w całości
+    chain = load_revision_chain(conn, note_id, first)
+    if chain is not None and not chain[-1].keyframe:
+        conn.execute(
+            'UPDATE revisions SET keyframe = 1, data = ? WHERE note_id = ? AND rev = ?',
+            (pack_text(revision_content(chain)), note_id, first)
+        )
+    conn.execute('DELETE FROM revisions WHERE note_id = ? AND rev < ?', (note_id, first))
+
+
+def write_note_update(conn, note_id, title, content, color, force_revision=False):
+    """Nadpisuje notatkę (poprzedni stan trafia do historii); zwraca Note albo None, gdy jej nie ma"""
+    note = Note.create(note_id, title, content, color, datetime.now().isoformat())
+    record_revision(conn, note_id, force_revision)
+
+    cursor = conn.execute(
+        'UPDATE notes SET title = ?, content = ?, color = ?, timestamp = ?, content_z = ?, preview = ?, modified = ?, '
+        'title_key = ? WHERE id = ?',
+        note.to_row()[1:] + (note_id,)
+    )
+    if cursor.rowcount == 0:
+        return None
+
+    log_change(conn, 'upsert', note_id)
+    return note
+
+
+def resync_from_primary():
+    """Pobiera pełną kopię notatek z primary i podmienia lokalną bazę w jednej transakcji"""
+    conn = get_db_connection()
+    try:
+        with fetch_from_primary('/api/replication/snapshot') as response:
+            epoch = response.headers['X-Replication-Epoch']
+            seq = int(response.headers['X-Replication-Seq'])
+            conn.execute('DELETE FROM notes')
+            batch = []
+            for note in read_ndjson(response):
+                batch.append(Note.from_json(note).to_row())
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    conn.executemany(f'INSERT INTO notes ({NOTE_COLUMNS}) VALUES ({NOTE_VALUES})', batch)
+                    batch = []
+            if batch:
+                conn.executemany(f'INSERT INTO notes ({NOTE_COLUMNS}) VALUES ({NOTE_VALUES})', batch)
+        set_meta(conn, 'replica_epoch', epoch)
+        set_meta(conn, 'replica_seq', seq)
+        conn.commit()
+    finally:
+        conn.close()
+    invalidate_lists(DATABASE)
+
+    _replication_stats['resyncs'] += 1
+    _replication_stats['applied_seq'] = seq
+
+
+def sync_from_primary():
+    """Pobiera i stosuje kolejne zmiany z dziennika primary; zwraca True, gdy replika nadąża"""
+    conn = get_db_connection()
+    try:
+        epoch = get_meta(conn, 'replica_epoch', '')
+        since = int(get_meta(conn, 'replica_seq', 0))
+    finally:
+        conn.close()
+
+    with fetch_from_primary(
+            f'/api/replication/changes?since={since}&epoch={epoch}&limit={REPLICATION_BATCH}') as response:
+        data = json.load(response)
+
+    _replication_stats['primary_seq'] = data['seq']
+    if data['reset'] or any(change['op'] == 'reset' for change in data['changes']):
+        resync_from_primary()
+        return False
+
+    conn = get_db_connection()
+    try:
+        for change in data['changes']:
+            if change['op'] == 'upsert':
+                conn.execute(
+                    f'INSERT OR REPLACE INTO notes ({NOTE_COLUMNS}) VALUES ({NOTE_VALUES})',
+                    Note.from_json(change['note']).to_row()
+                )
+            elif change['op'] == 'delete':
+                conn.execute('DELETE FROM notes WHERE id = ?', (change['id'],))
+            since = change['seq']
+        set_meta(conn, 'replica_seq', since)
+        conn.commit()
+    finally:
+        conn.close()
+    if data['changes']:
+        invalidate_lists(DATABASE)
+
+    _replication_stats['applied_seq'] = since
+    _replication_stats['last_sync_at'] = time.time()
+    return since >= data['seq']
+
+
+def _replication_loop():
+    while True:
+        try:
+            if sync_from_primary():
+                _replication_stats['caught_up_at'] = time.time()
+                time.sleep(REPLICATION_POLL_INTERVAL)
+        except (OSError, ValueError, KeyError, sqlite3.Error) as e:
+            _replication_stats['errors'] += 1
+            _replication_stats['last_error'] = str(e)
+            time.sleep(REPLICATION_POLL_INTERVAL)
+
+
+def start_replication():
+    """Uruchamia wątek repliki (tylko gdy ustawiono KEEP_REPLICA_OF)"""
+    global _replication_thread
+    if REPLICA_OF and _replication_thread is None:
+        _replication_thread = threading.Thread(target=_replication_loop, name='replication', daemon=True)
+        _replication_thread.start()
+
+
+def maintain_database(database, deadline):
+    """Jeden przebieg konserwacji bazy, przerywany po przekroczeniu deadline; True, jeśli doszedł do końca"""
+    # Krótki timeout - przy zajętej bazie konserwacja ustępuje zapisom
+    conn = sqlite3.connect(database, timeout=0.05)
+    try:
+        conn.execute('PRAGMA optimize')
+
+        while time.monotonic() < deadline and conn.execute('PRAGMA freelist_count').fetchone()[0] > 0:
+            before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            conn.execute(f'PRAGMA incremental_vacuum({MAINTENANCE_VACUUM_PAGES})').fetchall()
+            _maintenance_stats['pages_vacuumed'] += before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+        if time.monotonic() < deadline:
+            busy, wal_pages, checkpointed = conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+            _maintenance_stats['checkpoints'] += 1
+            # Cały WAL przeniesiony do bazy - duży plik WAL można przyciąć
+            if not busy and wal_pages == checkpointed and wal_pages > WAL_TRUNCATE_PAGES:
+                conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+                _maintenance_stats['wal_truncates'] += 1
+            return True
+        return False
+    finally:
+        conn.close()
+
+
+def run_maintenance():
+    """Przebieg konserwacji baz w ramach MAINTENANCE_BUDGET; pomijany, gdy niedawno były zapisy.
+
+    Bazy są obsługiwane po kolei od miejsca, w którym skończył poprzedni
+    przebieg (z zawinięciem), więc przy wielu notatnikach każdy dostaje swoją
+    kolej, a nie tylko te na początku listy.
+    """
+    global _maintenance_cursor
+    if time.monotonic() - _last_write_at < MAINTENANCE_IDLE_AFTER:
+        _maintenance_stats['skipped_busy'] += 1
+        return
+
+    started = time.monotonic()
+    deadline = started + MAINTENANCE_BUDGET
+    databases = all_databases()
+    # Lista jest posortowana - kursor działa także wtedy, gdy jego baza została usunięta
+    start = next((i for i, database in enumerate(databases) if database > _maintenance_cursor), 0)
+    for database in databases[start:] + databases[:start]:
+        if time.monotonic() >= deadline:
+            break
+        try:
+            if not maintain_database(database, deadline):
+                # Przerwana przez budżet - następny przebieg zacznie od niej
+                break
+        except sqlite3.OperationalError:
+            # Baza zablokowana przez zapis - spróbujemy przy następnym okrążeniu
+            _maintenance_stats['skipped_busy'] += 1
+        _maintenance_cursor = database
+
+    _maintenance_stats['passes'] += 1
+    _maintenance_stats['last_pass_at'] = datetime.now().isoformat()
+    _maintenance_stats['last_pass_duration_ms'] = (time.monotonic() - started) * 1000
+
+
+def _maintenance_loop():
+    while True:
+        time.sleep(MAINTENANCE_INTERVAL)
+        run_maintenance()
+
+
+def start_maintenance():
+    """Uruchamia wątek konserwacji w tle (tylko raz)"""
+    global _maintenance_thread
+    if MAINTENANCE_INTERVAL > 0 and _maintenance_thread is None:
+        _maintenance_thread = threading.Thread(target=_maintenance_loop, name='db-maintenance', daemon=True)
+        _maintenance_thread.start()
+
+
+def archive_database(database, now=None):
+    """Przenosi do archiwum notatki bazy nieruszane dłużej niż ARCHIVE_AFTER; zwraca ich liczbę"""
+    cutoff = (time.time() if now is None else now) - ARCHIVE_AFTER
+    archived = 0
+    conn = sqlite3.connect(database, timeout=5)
+    try:
+        while True:
+            rows = conn.execute(
+                f'SELECT {NOTE_COLUMNS} FROM notes WHERE modified < ? ORDER BY modified LIMIT ?',
+                (cutoff, ARCHIVE_BATCH)
+            ).fetchall()
+            if not rows:
+                break
+            stale = [Note.from_row(row) for row in rows]
+
+            # Najpierw zapis w archiwum, potem usunięcie z bazy - tylko notatek niezmienionych w międzyczasie
+            store_archived(database, stale)
+            moved = []
+            for note in stale:
+                if conn.execute('DELETE FROM notes WHERE id = ? AND timestamp = ?',
+                                (note.id, note.timestamp)).rowcount:
+                    moved.append(note.id)
+            # Wersje archiwalnej notatki są starsze niż REVISIONS_MAX_AGE
+            conn.executemany('DELETE FROM revisions WHERE note_id = ?', [(note_id,) for note_id in moved])
+            conn.commit()
+
+            moved_ids = set(moved)
+            remove_archived(database, [note.id for note in stale if note.id not in moved_ids])
+            if not moved:
+                break
+            archived += len(moved)
+            invalidate_lists(database)
+    finally:
+        conn.close()
+    return archived
+
+
+def archive_all_databases():
+    """Przebieg archiwizacji wszystkich baz; zwraca liczbę przeniesionych notatek"""
+    archived = 0
+    for database in all_databases():
+        try:
+            archived += archive_database(database)
+        except sqlite3.Error as e:
+            print(f"Błąd archiwizacji {database}: {e}")
+    record_archive_pass(archived)
+    return archived
+
+
+def restore_archived(conn, note_id):
+    """Przywraca notatkę z archiwum bieżącej bazy; zwraca Note albo None, gdy jej tam nie ma"""
+    note = get_archived(current_database(), note_id)
+    if note is None:
+        return None
+    conn.execute(f'INSERT OR IGNORE INTO notes ({NOTE_COLUMNS}) VALUES ({NOTE_VALUES})', hot_note(note).to_row())
+    conn.commit()
+    remove_archived(current_database(), [note_id])
+    record_restore()
+    return note
+
+
+def archived_only(conn, database):
+    """Notatki archiwum, których nie ma w bazie roboczej (po przerwanej archiwizacji bywają w obu)"""
+    for note in iter_archived(database):
+        if conn.execute('SELECT 1 FROM notes WHERE id = ?', (note.id,)).fetchone() is None:
+            yield note
+
+
+def _archive_loop():
+    while True:
+        time.sleep(ARCHIVE_INTERVAL)
+        archive_all_databases()
+
+
+def start_archiver():
+    """Uruchamia wątek archiwizacji w tle (tylko raz; replika trzyma wszystkie notatki w bazie)"""
+    global _archiver_thread
+    if ARCHIVE and ARCHIVE_INTERVAL > 0 and not REPLICA_OF and _archiver_thread is None:
+        _archiver_thread = threading.Thread(target=_archive_loop, name='archiver', daemon=True)
+        _archiver_thread.start()
+
+
+def notebook_stats():
+    with _notebooks_lock:
+        return {
+            'multi_notebook': MULTI_NOTEBOOK,
+            'open': len(_notebooks),
+            'max_open': MAX_OPEN_NOTEBOOKS,
+            **_notebook_stats,
+        }
+
 # Reszta kodu HTML - ten sam jak wcześniej
 HTML_TEMPLATE = '''
 <!DOCTYPE html>
@@ -91,7 +827,14 @@ HTML_TEMPLATE = '''
             max-height: calc(100vh - 200px);
         }
 
+        .notes-spacer { position: relative; }
+
         .note-item {
+            position: absolute;
+            left: 0;
+            right: 0;
+            height: 64px;
+            overflow: hidden;
             padding: 12px 15px;
             border-bottom: 1px solid #f0f0f0;
             cursor: pointer;
@@ -105,6 +848,9 @@ HTML_TEMPLATE = '''
             font-weight: bold; 
             margin-bottom: 4px;
             font-size: 14px;
+            white-space: nowrap;
+            overflow: hidden;
+            text-overflow: ellipsis;
         }
 
         .note-preview { 
@@ -211,8 +957,11 @@ HTML_TEMPLATE = '''
     <div class="container">
         <div class="notes-panel">
             <div class="notes-header">
-                <h3>📋 Notatki</h3>
-                <button class="btn btn-primary" onclick="createNote()">➕ Nowa</button>
+                <h3 id="notes-heading">📋 Notatki</h3>
+                <div>
+                    <button class="btn btn-secondary" id="archive-toggle" onclick="toggleArchive()">🗄️ Archiwum</button>
+                    <button class="btn btn-primary" onclick="createNote()">➕ Nowa</button>
+                </div>
             </div>
             <div class="notes-list" id="notes-list">
                 <div class="empty-state">
@@ -242,30 +991,342 @@ HTML_TEMPLATE = '''
 
     <script>
         let notes = [];
+        let notesById = new Map();
         let currentNote = null;
 
-        document.addEventListener('DOMContentLoaded', function() {
+        // Wirtualizowana lista: w DOM są tylko widoczne wiersze, aktualizowane po id
+        const NOTE_ROW_HEIGHT = 64;
+        const OVERSCAN_ROWS = 8;
+        let rowsById = new Map();
+        let notesSpacer = null;
+        let renderScheduled = false;
+
+        // Lokalna kopia notatek (IndexedDB) i kolejka zmian czekających na serwer
+        // Notatnik z adresu strony (?notebook=...) - serwer SQLite trzyma każdy w osobnym pliku
+        const NOTEBOOK = new URLSearchParams(location.search).get('notebook');
+        const LOCAL_DB_NAME = NOTEBOOK ? `keep-notatki-${NOTEBOOK}` : 'keep-notatki';
+        const LOCAL_DB_VERSION = 1;
+        const MAX_RETRY_DELAY = 60000;
+        let localDb = null;
+        let pendingOps = [];
+        let nextOpSeq = 1;
+        let syncing = false;
+        let inFlightSeq = null; // seq zmiany właśnie wysyłanej - nie wolno jej usunąć z kolejki
+        let syncError = null; // ostatni błąd odrzuconej przez serwer zmiany (zostaje w kolejce)
+        let retryDelay = 1000;
+        let retryTimer = null;
+        let backoffUntil = 0; // do tej chwili (Date.now()) nie wysyłamy żądań w tle - serwer prosił o przerwę
+
+        // Widok archiwum: notatki długo nieruszane, pobierane tylko na żądanie (bez odświeżania
+        // co 5 sekund i bez lokalnej kopii); workingNotes - lista robocza na czas przeglądania archiwum
+        let showArchived = false;
+        let workingNotes = null;
+
+        // Ładowanie notatek przy starcie - najpierw z lokalnej kopii, potem z serwera
+        document.addEventListener('DOMContentLoaded', async function() {
+            await openLocalDb();
+            const notesList = document.getElementById('notes-list');
+            notesList.addEventListener('scroll', scheduleRenderNotesList);
+            notesList.addEventListener('click', event => {
+                const row = event.target.closest('.note-item');
+                if (row) selectNote(Number(row.dataset.id));
+            });
+            window.addEventListener('resize', scheduleRenderNotesList);
+
+            await loadLocalState();
             loadNotes();
-            setInterval(loadNotes, 5000);
+            setInterval(() => { if (!showArchived) loadNotes(); }, 5000); // Odświeżaj co 5 sekund
+            window.addEventListener('online', syncQueue);
         });
 
+        function openLocalDb() {
+            return new Promise(resolve => {
+                if (!window.indexedDB) {
+                    resolve(null);
+                    return;
+                }
+                const request = indexedDB.open(LOCAL_DB_NAME, LOCAL_DB_VERSION);
+                request.onupgradeneeded = () => {
+                    request.result.createObjectStore('notes', { keyPath: 'id' });
+                    request.result.createObjectStore('queue', { keyPath: 'seq' });
+                };
+                request.onsuccess = () => {
+                    localDb = request.result;
+                    resolve(localDb);
+                };
+                request.onerror = () => resolve(null);
+            });
+        }
+
+        // Wykonuje operacje na magazynie IndexedDB w jednej transakcji
+        function localTx(storeName, mode, fn) {
+            return new Promise(resolve => {
+                if (!localDb) {
+                    resolve(undefined);
+                    return;
+                }
+                const tx = localDb.transaction(storeName, mode);
+                const request = fn(tx.objectStore(storeName));
+                tx.oncomplete = () => resolve(request ? request.result : undefined);
+                tx.onerror = () => resolve(undefined);
+            });
+        }
+
+        async function loadLocalState() {
+            const cachedNotes = await localTx('notes', 'readonly', store => store.getAll());
+            const cachedOps = await localTx('queue', 'readonly', store => store.getAll());
+
+            pendingOps = cachedOps || [];
+            pendingOps.sort((a, b) => a.seq - b.seq);
+            nextOpSeq = pendingOps.length > 0 ? pendingOps[pendingOps.length - 1].seq + 1 : 1;
+
+            if (cachedNotes && cachedNotes.length > 0) {
+                // Kolejność jak z serwera: najpierw zapisane, nowe (tymczasowe id) na końcu
+                const rank = note => note.order ?? Number.MAX_SAFE_INTEGER;
+                setNotes(cachedNotes.sort((a, b) => rank(a) - rank(b)));
+                renderNotesList();
+                updateCount();
+                updateStatus(`Załadowano ${notes.length} notatek z pamięci lokalnej`);
+            }
+        }
+
+        function cacheNote(note) {
+            return localTx('notes', 'readwrite', store => store.put(note));
+        }
+
+        function uncacheNote(noteId) {
+            return localTx('notes', 'readwrite', store => store.delete(noteId));
+        }
+
+        // Zapisuje w IndexedDB tylko notatki, które zmieniły się od ostatniego odczytu
+        function cacheServerNotes(previousNotes, serverNotes) {
+            const previous = new Map(previousNotes.map(note => [note.id, note]));
+            return localTx('notes', 'readwrite', store => {
+                serverNotes.forEach((note, index) => {
+                    note.order = index;
+                    const old = previous.get(note.id);
+                    previous.delete(note.id);
+                    if (!old || old.timestamp !== note.timestamp || old.order !== index) {
+                        store.put(note);
+                    }
+                });
+                previous.forEach((note, noteId) => store.delete(noteId));
+                return null;
+            });
+        }
+
+        function enqueueOp(op) {
+            // Starsze zmiany tej samej notatki są zbędne - wysyłamy pełny stan;
+            // zmiana w trakcie wysyłania zostaje, syncQueue usunie ją po odpowiedzi serwera
+            const queued = pending => pending.seq !== inFlightSeq && pending.noteId === op.noteId;
+            if (op.type === 'update') {
+                dropOps(pending => queued(pending) && pending.type === 'update');
+            }
+            if (op.type === 'delete') {
+                // Notatka, której serwer jeszcze nie dostał, znika bez żądania DELETE
+                const unsynced = pendingOps.some(pending => queued(pending) && pending.type === 'create');
+                dropOps(queued);
+                if (unsynced) return;
+            }
+
+            op.seq = nextOpSeq++;
+            pendingOps.push(op);
+            localTx('queue', 'readwrite', store => store.put(op));
+        }
+
+        function dropOps(predicate) {
+            const dropped = pendingOps.filter(predicate);
+            if (dropped.length === 0) return;
+            pendingOps = pendingOps.filter(op => !predicate(op));
+            localTx('queue', 'readwrite', store => {
+                dropped.forEach(op => store.delete(op.seq));
+                return null;
+            });
+        }
+
+        async function apiFetch(url, options = {}) {
+            const headers = { ...(options.headers || {}) };
+            if (NOTEBOOK) headers['X-Notebook'] = NOTEBOOK;
+            const response = await fetch(url, { ...options, headers });
+            if (response.status === 429 || response.status === 503) {
+                // Limit żądań lub przeciążenie - wstrzymaj odświeżanie i kolejkę na czas z Retry-After
+                const seconds = parseInt(response.headers.get('Retry-After'), 10);
+                backoffUntil = Date.now() + (seconds > 0 ? seconds * 1000 : retryDelay);
+            }
+            return response;
+        }
+
+        function sendOp(op) {
+            const headers = { 'Content-Type': 'application/json' };
+            if (op.type === 'create') {
+                return apiFetch('/api/notes', { method: 'POST', headers, body: JSON.stringify(op.data) });
+            }
+            if (op.type === 'update') {
+                return apiFetch(`/api/notes/${op.noteId}`, { method: 'PUT', headers, body: JSON.stringify(op.data) });
+            }
+            return apiFetch(`/api/notes/${op.noteId}`, { method: 'DELETE' });
+        }
+
+        // Odtwarza kolejkę zmian po kolei; przy braku sieci lub przeciążeniu serwera ponawia z opóźnieniem
+        async function syncQueue() {
+            if (syncing || Date.now() < backoffUntil) return;
+            syncing = true;
+            try {
+                while (pendingOps.length > 0) {
+                    const op = pendingOps[0];
+                    inFlightSeq = op.seq;
+                    const response = await sendOp(op);
+
+                    if (response.status === 429 || response.status >= 500) {
+                        scheduleRetry(response.headers.get('Retry-After'));
+                        setConnectionStatus(false);
+                        return;
+                    }
+
+                    if (!response.ok && response.status !== 404) {
+                        // Odrzucona zmiana (np. 403 na replice) zostaje w kolejce - nie gubimy edycji
+                        const body = await response.json().catch(() => ({}));
+                        syncError = body.error || `HTTP ${response.status}`;
+                        updateStatus(`❌ Nie zapisano na serwerze: ${syncError}`);
+                        scheduleRetry(null);
+                        return;
+                    }
+
+                    if (op.type === 'create' && response.ok) {
+                        await remapNoteId(op.noteId, await response.json());
+                    }
+
+                    // 404 (notatka usunięta w innym miejscu) - nie ma już czego zmieniać
+                    syncError = null;
+                    pendingOps = pendingOps.filter(pending => pending.seq !== op.seq);
+                    await localTx('queue', 'readwrite', store => store.delete(op.seq));
+                }
+                retryDelay = 1000;
+                setConnectionStatus(true);
+            } catch (error) {
+                scheduleRetry(null);
+                setConnectionStatus(false);
+            } finally {
+                inFlightSeq = null;
+                syncing = false;
+            }
+        }
+
+        function scheduleRetry(retryAfter) {
+            if (retryTimer) return;
+            const seconds = parseInt(retryAfter, 10);
+            const delay = seconds > 0 ? seconds * 1000 : retryDelay * (0.5 + Math.random());
+            retryDelay = Math.min(retryDelay * 2, MAX_RETRY_DELAY);
+            retryTimer = setTimeout(() => {
+                retryTimer = null;
+                syncQueue();
+            }, delay);
+        }
+
+        // Notatka utworzona offline dostaje od serwera właściwe id
+        async function remapNoteId(tempId, createdNote) {
+            const note = notesById.get(tempId);
+            if (note) {
+                notesById.delete(tempId);
+                note.id = createdNote.id;
+                notesById.set(note.id, note);
+                note.timestamp = createdNote.timestamp;
+                await uncacheNote(tempId);
+                await cacheNote(note);
+            }
+            pendingOps.forEach(op => {
+                if (op.noteId === tempId) {
+                    op.noteId = createdNote.id;
+                    localTx('queue', 'readwrite', store => store.put(op));
+                }
+            });
+            renderNotesList();
+        }
+
+        function setConnectionStatus(online) {
+            const status = document.getElementById('connection-status');
+            if (online) {
+                status.textContent = '🟢 Połączono';
+            } else {
+                status.textContent = `🔴 Offline (w kolejce: ${pendingOps.length})`;
+            }
+        }
+
+        function updateCount() {
+            document.getElementById('notes-count').textContent =
+                `${showArchived ? 'W archiwum' : 'Notatek'}: ${notes.length}`;
+        }
+
         async function loadNotes() {
+            if (Date.now() < backoffUntil) return;
+
+            // Niewysłane zmiany lokalne mają pierwszeństwo przed stanem z serwera
+            await syncQueue();
+            if (pendingOps.length > 0) return;
+
             try {
-                const response = await fetch('/api/notes');
-                notes = await response.json();
+                const archived = showArchived;
+                const response = await apiFetch(archived ? '/api/notes?archived=1' : '/api/notes');
+                if (!response.ok) {
+                    setConnectionStatus(false);
+                    return;
+                }
+                const serverNotes = await response.json();
+                if (pendingOps.length > 0 || archived !== showArchived) return;
+
+                // Lokalna kopia trzyma tylko notatki robocze
+                if (!archived) await cacheServerNotes(notes, serverNotes);
+                setNotes(serverNotes);
+                if (currentNote) {
+                    currentNote = notesById.get(currentNote.id) || currentNote;
+                }
                 renderNotesList();
-                updateStatus(`Załadowano ${notes.length} notatek`);
-                document.getElementById('notes-count').textContent = `Notatek: ${notes.length}`;
+                updateStatus(archived ? `Archiwum: ${notes.length} notatek` : `Załadowano ${notes.length} notatek`);
+                updateCount();
+                setConnectionStatus(true);
             } catch (error) {
-                updateStatus('❌ Błąd ładowania notatek');
-                document.getElementById('connection-status').textContent = '🔴 Błąd połączenia';
+                updateStatus('❌ Błąd ładowania notatek - praca offline');
+                setConnectionStatus(false);
             }
         }
 
+        async function toggleArchive() {
+            showArchived = !showArchived;
+            if (showArchived) {
+                workingNotes = notes;
+                setNotes([]);
+            } else {
+                setNotes(workingNotes || []);
+                workingNotes = null;
+            }
+            document.getElementById('notes-heading').textContent = showArchived ? '🗄️ Archiwum' : '📋 Notatki';
+            document.getElementById('archive-toggle').textContent = showArchived ? '📋 Notatki' : '🗄️ Archiwum';
+            renderNotesList();
+            updateCount();
+            // Edycja notatki z archiwum przywraca ją na serwerze do notatek roboczych
+            await loadNotes();
+        }
+
+        function setNotes(list) {
+            notes = list;
+            notesById = new Map(notes.map(note => [note.id, note]));
+        }
+
+        function scheduleRenderNotesList() {
+            if (renderScheduled) return;
+            renderScheduled = true;
+            requestAnimationFrame(() => {
+                renderScheduled = false;
+                renderNotesList();
+            });
+        }
+
         function renderNotesList() {
             const container = document.getElementById('notes-list');
 
             if (notes.length === 0) {
+                notesSpacer = null;
+                rowsById.clear();
                 container.innerHTML = `
                     <div class="empty-state">
                         <p>Brak notatek</p>
@@ -275,25 +1336,99 @@ HTML_TEMPLATE = '''
                 return;
             }
 
-            container.innerHTML = notes.map(note => `
-                <div class="note-item ${currentNote && currentNote.id === note.id ? 'active' : ''}" 
-                     onclick="selectNote(${note.id})" 
-                     style="border-left-color: ${note.color || '#1976d2'}">
-                    <div class="note-title">${note.title || 'Bez tytułu'}</div>
-                    <div class="note-preview">${note.content.substring(0, 50)}${note.content.length > 50 ? '...' : ''}</div>
-                </div>
-            `).join('');
+            if (!notesSpacer) {
+                container.innerHTML = '';
+                notesSpacer = document.createElement('div');
+                notesSpacer.className = 'notes-spacer';
+                container.appendChild(notesSpacer);
+            }
+            notesSpacer.style.height = `${notes.length * NOTE_ROW_HEIGHT}px`;
+
+            const first = Math.max(0, Math.floor(container.scrollTop / NOTE_ROW_HEIGHT) - OVERSCAN_ROWS);
+            const last = Math.min(notes.length,
+                Math.ceil((container.scrollTop + container.clientHeight) / NOTE_ROW_HEIGHT) + OVERSCAN_ROWS);
+            const visibleNotes = notes.slice(first, last);
+            const visibleIds = new Set(visibleNotes.map(note => note.id));
+
+            // Wiersze, które wypadły z widoku, są używane ponownie dla nowych notatek
+            const spareRows = [];
+            rowsById.forEach((row, noteId) => {
+                if (!visibleIds.has(noteId)) {
+                    spareRows.push(row);
+                    rowsById.delete(noteId);
+                }
+            });
+
+            visibleNotes.forEach((note, offset) => {
+                let row = rowsById.get(note.id);
+                if (!row) {
+                    row = spareRows.pop() || notesSpacer.appendChild(createNoteRow());
+                    rowsById.set(note.id, row);
+                }
+                patchNoteRow(row, note, first + offset);
+            });
+            spareRows.forEach(row => row.remove());
+        }
+
+        function createNoteRow() {
+            const row = document.createElement('div');
+            row.className = 'note-item';
+            row.innerHTML = '<div class="note-title"></div><div class="note-preview"></div>';
+            return row;
         }
 
-        function selectNote(noteId) {
-            currentNote = notes.find(note => note.id === noteId);
+        // Zmienia w wierszu tylko te elementy, które faktycznie się różnią
+        function patchNoteRow(row, note, index) {
+            const content = note.content ?? note.preview ?? '';
+            const title = note.title || 'Bez tytułu';
+            const preview = `${content.substring(0, 50)}${content.length > 50 ? '...' : ''}`;
+            const color = note.color || '#1976d2';
+            const top = `${index * NOTE_ROW_HEIGHT}px`;
+
+            if (row.dataset.id !== String(note.id)) row.dataset.id = note.id;
+            if (row.style.top !== top) row.style.top = top;
+            if (row.dataset.color !== color) {
+                row.dataset.color = color;
+                row.style.borderLeftColor = color;
+            }
+            row.classList.toggle('active', currentNote !== null && currentNote.id === note.id);
+            if (row.firstChild.textContent !== title) row.firstChild.textContent = title;
+            if (row.lastChild.textContent !== preview) row.lastChild.textContent = preview;
+        }
+
+        async function selectNote(noteId) {
+            const note = notesById.get(noteId);
+            if (!note) return;
+
+            // Duże notatki przychodzą na liście jako podgląd - pełną treść pobieramy przy otwarciu
+            if (note.truncated && !(await loadFullNote(note))) {
+                updateStatus('❌ Nie udało się pobrać pełnej treści notatki');
+                return;
+            }
+
+            currentNote = note;
             if (currentNote) {
                 renderEditor();
-                renderNotesList();
+                renderNotesList(); // Odśwież listę dla active state
                 updateStatus(`Załadowano: ${currentNote.title}`);
             }
         }
 
+        async function loadFullNote(note) {
+            try {
+                const response = await apiFetch(`/api/notes/${note.id}`);
+                if (!response.ok) return false;
+                const fullNote = await response.json();
+                note.content = fullNote.content;
+                delete note.preview;
+                delete note.truncated;
+                if (!showArchived) cacheNote(note);
+                return true;
+            } catch (error) {
+                return false;
+            }
+        }
+
         function renderEditor() {
             const container = document.getElementById('editor-content');
             const backgroundColor = currentNote.color || '#ffffff';
@@ -311,36 +1446,48 @@ HTML_TEMPLATE = '''
             `;
         }
 
+        function syncedStatus(message) {
+            if (syncError) {
+                updateStatus(`❌ Nie zapisano na serwerze: ${syncError}`);
+            } else {
+                updateStatus(pendingOps.length > 0 ? '💾 Zapisano lokalnie - czeka na synchronizację' : message);
+            }
+        }
+
         async function createNote() {
+            if (showArchived) await toggleArchive();
+
+            // Notatka powstaje od razu lokalnie z tymczasowym (ujemnym) id
             const newNote = {
+                id: -Date.now(),
                 title: 'Nowa notatka',
                 content: '',
-                color: '#ffffff'
+                color: '#ffffff',
+                timestamp: new Date().toISOString()
             };
 
-            try {
-                const response = await fetch('/api/notes', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify(newNote)
-                });
-
-                if (response.ok) {
-                    const createdNote = await response.json();
-                    notes.push(createdNote);
-                    currentNote = createdNote;
-                    renderNotesList();
-                    renderEditor();
-                    updateStatus('✅ Nowa notatka utworzona');
-
-                    setTimeout(() => {
-                        document.getElementById('note-title').focus();
-                        document.getElementById('note-title').select();
-                    }, 100);
-                }
-            } catch (error) {
-                updateStatus('❌ Błąd tworzenia notatki');
-            }
+            notes.push(newNote);
+            notesById.set(newNote.id, newNote);
+            currentNote = newNote;
+            cacheNote(newNote);
+            enqueueOp({
+                type: 'create',
+                noteId: newNote.id,
+                data: { title: newNote.title, content: newNote.content, color: newNote.color }
+            });
+
+            renderNotesList();
+            renderEditor();
+            updateCount();
+
+            // Fokus na tytuł
+            setTimeout(() => {
+                document.getElementById('note-title').focus();
+                document.getElementById('note-title').select();
+            }, 100);
+
+            await syncQueue();
+            syncedStatus('✅ Nowa notatka utworzona');
         }
 
         async function saveNote() {
@@ -358,22 +1505,14 @@ HTML_TEMPLATE = '''
                 color: currentNote.color || '#ffffff'
             };
 
-            try {
-                const response = await fetch(`/api/notes/${currentNote.id}`, {
-                    method: 'PUT',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify(updatedNote)
-                });
+            currentNote.title = updatedNote.title;
+            currentNote.content = updatedNote.content;
+            cacheNote(currentNote);
+            enqueueOp({ type: 'update', noteId: currentNote.id, data: updatedNote });
+            renderNotesList();
 
-                if (response.ok) {
-                    currentNote.title = updatedNote.title;
-                    currentNote.content = updatedNote.content;
-                    renderNotesList();
-                    updateStatus('✅ Notatka zapisana');
-                }
-            } catch (error) {
-                updateStatus('❌ Błąd zapisywania');
-            }
+            await syncQueue();
+            syncedStatus('✅ Notatka zapisana');
         }
 
         async function deleteNote() {
@@ -383,28 +1522,23 @@ HTML_TEMPLATE = '''
             }
 
             if (confirm(`Czy na pewno chcesz usunąć notatkę "${currentNote.title}"?`)) {
-                try {
-                    const response = await fetch(`/api/notes/${currentNote.id}`, {
-                        method: 'DELETE'
-                    });
-
-                    if (response.ok) {
-                        notes = notes.filter(note => note.id !== currentNote.id);
-                        currentNote = null;
-                        renderNotesList();
-
-                        document.getElementById('editor-content').innerHTML = `
-                            <div class="empty-state">
-                                <p>Wybierz notatkę do edycji</p>
-                                <p>lub utwórz nową</p>
-                            </div>
-                        `;
-
-                        updateStatus('✅ Notatka usunięta');
-                    }
-                } catch (error) {
-                    updateStatus('❌ Błąd usuwania');
-                }
+                const noteId = currentNote.id;
+                setNotes(notes.filter(note => note.id !== noteId));
+                currentNote = null;
+                uncacheNote(noteId);
+                enqueueOp({ type: 'delete', noteId: noteId });
+                renderNotesList();
+                updateCount();
+
+                document.getElementById('editor-content').innerHTML = `
+                    <div class="empty-state">
+                        <p>Wybierz notatkę do edycji</p>
+                        <p>lub utwórz nową</p>
+                    </div>
+                `;
+
+                await syncQueue();
+                syncedStatus('✅ Notatka usunięta');
             }
         }
 
@@ -420,16 +1554,19 @@ HTML_TEMPLATE = '''
             if (!currentNote) return;
 
             currentNote.color = color;
+
+            // Zastosuj kolor natychmiast
             document.getElementById('note-title').style.backgroundColor = color;
             document.getElementById('note-content').style.backgroundColor = color;
 
+            // Zapisz automatycznie
             await saveNote();
         }
 
         let autoSaveTimer;
         function autoSave() {
             if (autoSaveTimer) clearTimeout(autoSaveTimer);
-            autoSaveTimer = setTimeout(saveNote, 2000);
+            autoSaveTimer = setTimeout(saveNote, 2000); // Auto-zapis po 2 sekundach
             updateStatus('Edytowanie... (automatyczny zapis za 2s)');
         }
 
@@ -442,6 +1579,34 @@ HTML_TEMPLATE = '''
 '''
 
 
+@app.before_request
+def select_notebook():
+    """Wybiera notatnik dla żądania (tylko w trybie wielu notatników)"""
+    if not MULTI_NOTEBOOK:
+        return None
+    name = request.headers.get('X-Notebook') or request.args.get('notebook') or DEFAULT_NOTEBOOK
+    if not NOTEBOOK_NAME_RE.match(name):
+        return jsonify({'error': 'Nieprawidłowa nazwa notatnika'}), 400
+    g.notebook = name
+    return None
+
+
+# Replika przyjmuje tylko odczyty notatek i nie udostępnia dziennika zmian
+app.before_request(reject_writes_on_replica)
+
+
+@app.after_request
+def track_writes(response):
+    """Zapamiętuje czas ostatniego zapisu (konserwacja czeka na bezczynność) i unieważnia cache list"""
+    global _last_write_at
+    if request.method in ('POST', 'PUT', 'DELETE'):
+        _last_write_at = time.monotonic()
+        # Po zatwierdzeniu transakcji w handlerze; odrzucone żądania niczego nie zmieniły
+        if response.status_code < 400:
+            invalidate_lists(current_database())
+    return response
+
+
 @app.route('/')
 def home():
     """Główna strona aplikacji"""
@@ -451,23 +1616,84 @@ def home():
 
 @app.route('/api/notes', methods=['GET'])
 def get_notes():
-    """API: Pobiera wszystkie notatki"""
-    conn = get_db_connection()
-    notes = conn.execute('SELECT * FROM notes ORDER BY id DESC').fetchall()
-    conn.close()
-    
-    # Konwertuj na słowniki
-    notes_list = []
-    for note in notes:
-        notes_list.append({
-            'id': note['id'],
-            'title': note['title'],
-            'content': note['content'],
-            'color': note['color'],
-            'timestamp': note['timestamp']
-        })
-    
-    return jsonify(notes_list)
+    """API: Pobiera notatki (duże - tylko z podglądem)
+
+    Opcjonalnie ?color=, ?modified_after=, ?modified_before= i ?sort=modified|created|title;
+    ?archived=1 - notatki z archiwum zamiast bazy roboczej
+    """
+    try:
+        color, after, before, sort = parse_list_query(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Błędne parametry listy - {e}'}), 400
+
+    conditions = []
+    params = []
+    if color is not None:
+        conditions.append('color = ?')
+        params.append(color)
+    if after is not None:
+        conditions.append('modified > ?')
+        params.append(after)
+    if before is not None:
+        conditions.append('modified < ?')
+        params.append(before)
+    where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+
+    if request.args.get('archived') == '1':
+        return jsonify([{**note.summary(), 'archived': True}
+                        for note in list_archived(current_database(), color, after, before, sort)])
+
+    def build():
+        # Bez kolumny content_z - lista nigdy nie rozpakowuje treści
+        with db_connection() as conn:
+            notes = conn.execute(
+                f'SELECT {NOTE_SUMMARY_COLUMNS} FROM notes{where} ORDER BY {note_order(sort, after, before)}', params
+            ).fetchall()
+        return [Note.from_row(note).summary() for note in notes]
+
+    # Gotowe bajty odpowiedzi z cache - unieważniane po każdym zapisie (track_writes)
+    return cached_list_response(current_database(), (color, after, before, sort), build)
+
+
+@app.route('/api/notes/suggest', methods=['GET'])
+def suggest_titles():
+    """API: Podpowiedzi tytułów - ?prefix= (bez wielkości liter i polskich znaków), opcjonalnie ?limit="""
+    try:
+        prefix, limit = parse_suggest_query(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Błędne parametry podpowiedzi - {e}'}), 400
+    if not prefix:
+        return jsonify([])
+
+    with db_connection() as conn:
+        rows = conn.execute(
+            'SELECT title_key, id, title, color FROM notes WHERE title_key >= ? AND title_key < ? '
+            'ORDER BY title_key, id LIMIT ?',
+            (prefix, prefix_upper_bound(prefix), limit)
+        ).fetchall()
+
+    matches = [(row[0], row[1], {'id': row[1], 'title': row[2], 'color': row[3]}) for row in rows]
+    hot_ids = {note_id for _, note_id, _ in matches}
+    matches += [(key, note_id, {'id': note_id, 'title': title, 'color': color, 'archived': True})
+                for key, note_id, title, color in suggest_archived(current_database(), prefix, limit)
+                if note_id not in hot_ids]
+    matches.sort(key=lambda match: match[:2])
+    return jsonify([match[2] for match in matches[:limit]])
+
+
+@app.route('/api/notes/<int:note_id>', methods=['GET'])
+def get_note(note_id):
+    """API: Pobiera jedną notatkę z pełną treścią"""
+    with db_connection() as conn:
+        note = conn.execute(f'SELECT {NOTE_COLUMNS} FROM notes WHERE id = ?', (note_id,)).fetchone()
+
+    if note is None:
+        archived = get_archived(current_database(), note_id)
+        if archived is not None:
+            return jsonify({**archived.full(), 'archived': True})
+        return jsonify({'error': 'Notatka nie znaleziona'}), 404
+
+    return jsonify(Note.from_row(note).full())
 
 
 @app.route('/api/notes', methods=['POST'])
@@ -475,33 +1701,22 @@ def add_note():
     """API: Dodaje nową notatkę"""
     data = request.json
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    content = text_value(data.get('content', ''))
+    note = Note.create(None, data.get('title', 'Nowa notatka'), content,
+                       data.get('color', '#ffffff'), datetime.now().isoformat())
     
-    cursor.execute(
-        'INSERT INTO notes (title, content, color, timestamp) VALUES (?, ?, ?, ?)',
-        (
-            data.get('title', 'Nowa notatka'),
-            data.get('content', ''),
-            data.get('color', '#ffffff'),
-            datetime.now().isoformat()
-        )
-    )
-    
-    note_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        
+        # id = NULL - nadaje je SQLite
+        cursor.execute(f'INSERT INTO notes ({NOTE_COLUMNS}) VALUES ({NOTE_VALUES})', note.to_row())
+        
+        note.id = cursor.lastrowid
+        log_change(conn, 'upsert', note.id)
+        conn.commit()
     
     # Zwróć utworzoną notatkę
-    note = {
-        'id': note_id,
-        'title': data.get('title', 'Nowa notatka'),
-        'content': data.get('content', ''),
-        'color': data.get('color', '#ffffff'),
-        'timestamp': datetime.now().isoformat()
-    }
-    
-    return jsonify(note), 201
+    return jsonify(note.full(content)), 201
 
 
 @app.route('/api/notes/<int:note_id>', methods=['PUT'])
@@ -509,61 +1724,315 @@ def update_note(note_id):
     """API: Aktualizuje notatkę"""
     data = request.json
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        'UPDATE notes SET title = ?, content = ?, color = ?, timestamp = ? WHERE id = ?',
-        (
-            data.get('title'),
-            data.get('content'),
-            data.get('color'),
-            datetime.now().isoformat(),
-            note_id
-        )
-    )
-    
-    if cursor.rowcount == 0:
-        conn.close()
-        return jsonify({'error': 'Notatka nie znaleziona'}), 404
-    
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        # Zmiana archiwalnej notatki przywraca ją najpierw do bazy roboczej
+        if conn.execute('SELECT 1 FROM notes WHERE id = ?', (note_id,)).fetchone() is None:
+            restore_archived(conn, note_id)
+
+        note = write_note_update(conn, note_id, data.get('title'), data.get('content'), data.get('color'))
+        
+        if note is None:
+            return jsonify({'error': 'Notatka nie znaleziona'}), 404
+        
+        conn.commit()
     
     # Zwróć zaktualizowaną notatkę
-    note = {
-        'id': note_id,
-        'title': data.get('title'),
-        'content': data.get('content'),
-        'color': data.get('color'),
-        'timestamp': datetime.now().isoformat()
-    }
-    
-    return jsonify(note)
+    return jsonify(note.full(text_value(data.get('content'))))
 
 
 @app.route('/api/notes/<int:note_id>', methods=['DELETE'])
 def delete_note(note_id):
     """API: Usuwa notatkę"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('DELETE FROM notes WHERE id = ?', (note_id,))
-    
-    if cursor.rowcount == 0:
-        conn.close()
-        return jsonify({'error': 'Notatka nie znaleziona'}), 404
-    
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute('DELETE FROM notes WHERE id = ?', (note_id,))
+        
+        if cursor.rowcount == 0 and not remove_archived(current_database(), [note_id]):
+            return jsonify({'error': 'Notatka nie znaleziona'}), 404
+        
+        cursor.execute('DELETE FROM revisions WHERE note_id = ?', (note_id,))
+        log_change(conn, 'delete', note_id)
+        conn.commit()
     
     return jsonify({'message': 'Notatka usunięta'})
 
 
+@app.route('/api/notes/<int:note_id>/revisions', methods=['GET'])
+def get_revisions(note_id):
+    """API: Historia wersji notatki (od najnowszej, bez treści)"""
+    with db_connection() as conn:
+        if conn.execute('SELECT 1 FROM notes WHERE id = ?', (note_id,)).fetchone() is None:
+            return jsonify({'error': 'Notatka nie znaleziona'}), 404
+        rows = conn.execute(
+            f'SELECT {REVISION_COLUMNS} FROM revisions WHERE note_id = ? ORDER BY rev DESC', (note_id,)
+        ).fetchall()
+
+    return jsonify([Revision.from_row(row).summary() for row in rows])
+
+
+@app.route('/api/notes/<int:note_id>/revisions/<int:rev>', methods=['GET'])
+def get_revision(note_id, rev):
+    """API: Jedna wersja notatki z pełną treścią"""
+    with db_connection() as conn:
+        chain = load_revision_chain(conn, note_id, rev)
+
+    if chain is None:
+        return jsonify({'error': 'Wersja nie znaleziona'}), 404
+
+    return jsonify(chain[-1].full(revision_content(chain)))
+
+
+@app.route('/api/notes/<int:note_id>/revisions/<int:rev>/restore', methods=['POST'])
+def restore_revision(note_id, rev):
+    """API: Przywraca wersję notatki (bieżący stan trafia do historii, więc można to cofnąć)"""
+    with db_connection() as conn:
+        chain = load_revision_chain(conn, note_id, rev)
+        if chain is None:
+            return jsonify({'error': 'Wersja nie znaleziona'}), 404
+
+        revision = chain[-1]
+        content = revision_content(chain)
+        note = write_note_update(conn, note_id, revision.title, content, revision.color, force_revision=True)
+        if note is None:
+            return jsonify({'error': 'Notatka nie znaleziona'}), 404
+
+        conn.commit()
+
+    return jsonify(note.full(content))
+
+
+@app.route('/api/export', methods=['GET'])
+def export_notes():
+    """API: Eksportuje wszystkie notatki (także z archiwum) jako strumień NDJSON (prosto z kursora)"""
+    # Osobne połączenie - eksport nie blokuje połączenia z puli na czas wysyłania
+    database = current_database()
+
+    def generate():
+        conn = get_db_connection(database)
+        try:
+            cursor = conn.execute(f'SELECT {NOTE_COLUMNS} FROM notes ORDER BY id')
+            chunk = []
+            for note in chain((Note.from_row(row) for row in cursor), archived_only(conn, database)):
+                chunk.append(json.dumps(note.full(), ensure_ascii=False))
+                if len(chunk) >= EXPORT_CHUNK_SIZE:
+                    yield '\n'.join(chunk) + '\n'
+                    chunk = []
+            if chunk:
+                yield '\n'.join(chunk) + '\n'
+        finally:
+            conn.close()
+
+    return Response(generate(), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': 'attachment; filename=notes.ndjson'})
+
+
+@app.route('/api/import', methods=['POST'])
+def import_notes():
+    """API: Importuje notatki ze strumienia NDJSON (notatki o tym samym id są zastępowane)"""
+    imported = 0
+    batch = []
+    imported_ids = []
+
+    # Najpierw cała treść żądania (plik tymczasowy) - transakcja importu i blokada notatnika
+    # nie czekają na wolnego klienta
+    with tempfile.SpooledTemporaryFile(IMPORT_SPOOL_MEMORY) as body:
+        shutil.copyfileobj(request.stream, body, 1 << 16)
+        body.seek(0)
+
+        # Cały import w jednej transakcji, wiersze wstawiane partiami przez executemany
+        with db_connection() as conn:
+            def flush_batch():
+                conn.executemany(f'INSERT OR REPLACE INTO notes ({NOTE_COLUMNS}) VALUES ({NOTE_VALUES})', batch)
+                batch.clear()
+
+            try:
+                for data in read_ndjson(body):
+                    note_id = data.get('id')
+                    if isinstance(note_id, int):
+                        imported_ids.append(note_id)
+                    batch.append(Note.create(
+                        note_id if isinstance(note_id, int) else None,
+                        data.get('title', 'Nowa notatka'),
+                        data.get('content', ''),
+                        data.get('color', '#ffffff'),
+                        data.get('timestamp') or datetime.now().isoformat()
+                    ).to_row())
+                    imported += 1
+                    if len(batch) >= IMPORT_BATCH_SIZE:
+                        flush_batch()
+                if batch:
+                    flush_batch()
+                # Import nie trafia do dziennika zmiana po zmianie - repliki pobiorą pełną kopię
+                log_change(conn, 'reset')
+                conn.commit()
+            except (ValueError, sqlite3.Error) as e:
+                conn.rollback()
+                return jsonify({'error': f'Błędny plik importu - {e}'}), 400
+
+    # Zaimportowane notatki zastępują kopie w archiwum
+    remove_archived(current_database(), imported_ids)
+    return jsonify({'imported': imported})
+
+
+@app.route('/api/replication/changes', methods=['GET'])
+def get_changes():
+    """API (replikacja): Zmiany z dziennika o numerach większych niż ?since="""
+    since = request.args.get('since', 0, type=int)
+    epoch = request.args.get('epoch', '')
+    limit = min(request.args.get('limit', REPLICATION_BATCH, type=int), 10 * REPLICATION_BATCH)
+
+    with db_connection() as conn:
+        own_epoch = get_meta(conn, 'epoch')
+        latest, oldest = conn.execute('SELECT MAX(seq), MIN(seq) FROM changes').fetchone()
+        latest = latest or 0
+
+        # Inna epoka, luka w przyciętym dzienniku lub replika "z przyszłości" - potrzebna pełna kopia
+        if epoch != own_epoch or since > latest or (since < latest and (oldest is None or since < oldest - 1)):
+            return jsonify({'epoch': own_epoch, 'seq': latest, 'reset': True, 'changes': []})
+
+        # Bieżący stan notatki z tej samej transakcji odczytu co dziennik
+        rows = conn.execute(
+            f'SELECT changes.seq, changes.op, changes.note_id, changes.created, {CHANGE_NOTE_COLUMNS} '
+            "FROM changes LEFT JOIN notes ON changes.op = 'upsert' AND notes.id = changes.note_id "
+            'WHERE changes.seq > ? ORDER BY changes.seq LIMIT ?', (since, limit)
+        ).fetchall()
+
+    changes = []
+    for row in rows:
+        note = Note.from_row(tuple(row)[4:]) if row[4] is not None else None
+        op = row['op']
+        if op == 'upsert' and note is None:
+            # Notatka przeniesiona od tamtej pory do archiwum - z archiwum, usunięta - jako 'delete'
+            archived = get_archived(current_database(), row['note_id'])
+            if archived is None:
+                op = 'delete'
+            else:
+                note = hot_note(archived)
+        changes.append({
+            'seq': row['seq'],
+            'op': op,
+            'id': row['note_id'],
+            'note': note.to_json() if note is not None else None,
+            'created': row['created']
+        })
+    return jsonify({'epoch': own_epoch, 'seq': latest, 'reset': False, 'changes': changes})
+
+
+@app.route('/api/replication/snapshot', methods=['GET'])
+def get_replication_snapshot():
+    """API (replikacja): Pełna kopia notatek (NDJSON) z numerem zmiany, której odpowiada"""
+    database = current_database()
+
+    def generate(conn):
+        try:
+            chunk = []
+            # Replika dostaje też archiwum - sama go nie prowadzi
+            hot = (Note.from_row(row) for row in conn.execute(f'SELECT {NOTE_COLUMNS} FROM notes'))
+            archived = (hot_note(note) for note in archived_only(conn, database))
+            for note in chain(hot, archived):
+                chunk.append(json.dumps(note.to_json(), ensure_ascii=False))
+                if len(chunk) >= EXPORT_CHUNK_SIZE:
+                    yield '\n'.join(chunk) + '\n'
+                    chunk = []
+            if chunk:
+                yield '\n'.join(chunk) + '\n'
+            conn.rollback()
+        finally:
+            conn.close()
+
+    # Odczyt numeru zmiany i notatek w jednej transakcji - spójna kopia
+    conn = get_db_connection(database)
+    conn.execute('BEGIN')
+    seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM changes').fetchone()[0]
+    epoch = get_meta(conn, 'epoch')
+
+    return Response(generate(conn), mimetype='application/x-ndjson',
+                    headers={'X-Replication-Epoch': epoch, 'X-Replication-Seq': str(seq)})
+
+
+@app.route('/api/replication/status', methods=['GET'])
+def get_replication_status():
+    """API: Stan replikacji (rola, opóźnienie repliki)"""
+    return jsonify(replication_stats(_replication_stats))
+
+
+@app.route('/api/admin/backup', methods=['POST'])
+def create_backup():
+    """API (admin): Tworzy kopię zapasową bazy bieżącego notatnika"""
+    denied = admin_denied()
+    if denied:
+        return denied
+
+    database = current_database()
+    if not os.path.exists(database):
+        return jsonify({'error': 'Baza nie istnieje'}), 404
+
+    try:
+        target = backup_with_archive(database)
+    except (OSError, sqlite3.Error) as e:
+        return jsonify({'error': f'Błąd kopii zapasowej: {e}'}), 500
+
+    return jsonify({'backup': target, 'duration_ms': _backup_stats['last_backup_duration_ms']}), 201
+
+
+@app.route('/api/admin/archive', methods=['POST'])
+def run_archive():
+    """API (admin): Od razu przenosi do archiwum notatki bieżącego notatnika nieruszane dłużej niż ARCHIVE_AFTER"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    if REPLICA_OF:
+        return jsonify({'error': 'Replika nie prowadzi archiwum'}), 409
+
+    database = current_database()
+    if not os.path.exists(database):
+        return jsonify({'error': 'Baza nie istnieje'}), 404
+
+    archived = archive_database(database)
+    record_archive_pass(archived)
+    return jsonify({'archived': archived})
+
+
+@app.route('/api/admin/backups', methods=['GET'])
+def get_backups():
+    """API (admin): Lista kopii zapasowych bazy bieżącego notatnika"""
+    denied = admin_denied()
+    if denied:
+        return denied
+
+    backups = []
+    for name in list_backups(backup_name(current_database())):
+        path = os.path.join(BACKUP_DIR, name)
+        backups.append({'file': name, 'size': os.path.getsize(path)})
+    return jsonify(backups)
+
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """API: Metryki serwera (pula notatników, kopie zapasowe)"""
+    return jsonify({
+        'notebooks': notebook_stats(),
+        'backups': dict(_backup_stats),
+        'replication': replication_stats(_replication_stats),
+        'maintenance': dict(_maintenance_stats),
+        'admission': admission_stats(),
+        'list_cache': cache_stats(),
+        'archive': archive_stats(current_database()),
+    })
+
+
 if __name__ == '__main__':
     print("🚀 KEEP WEB SERVER (SQLite)")
-    print("📍 Lokalnie: http://localhost:5000")
-    print("🗄️ Baza danych: SQLite")
+    print(f"📍 Lokalnie: http://localhost:{PORT}")
+    print(f"🗄️ Baza danych: SQLite ({DATABASE})")
+    if REPLICA_OF:
+        print(f"🔁 Replika tylko do odczytu: {REPLICA_OF}")
     print("⚡ Otwórz w przeglądarce!")
 
-    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
+    init_db()
+    start_backup_scheduler()
+    start_replication()
+    start_maintenance()
+    start_archiver()
+    app.run(host='0.0.0.0', port=PORT, debug=False, threaded=True)
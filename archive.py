@@ -0,0 +1,210 @@
+"""Archiwum (zimny magazyn) notatek wspólne dla app.py i app_sqlite.py.
+
+Notatki nieruszane dłużej niż ARCHIVE_AFTER są przenoszone z magazynu
+roboczego do osobnego pliku SQLite obok niego (<magazyn>.archive.sqlite).
+Nie ma ich w domyślnej liście, w odpytywaniu klienta ani w zapisach magazynu
+roboczego, ale dalej można je pobrać po id, znaleźć w podpowiedziach tytułów
+i wylistować przez ?archived=1. Zmiana archiwalnej notatki przywraca ją do
+magazynu roboczego.
+
+Przeniesienie obejmuje dwa pliki, więc kolejność zapisów jest stała: najpierw
+zapis do miejsca docelowego, potem usunięcie ze źródła. Po awarii notatka
+może być w obu miejscach - wtedy obowiązuje wersja z magazynu roboczego,
+a kolejny przebieg archiwizacji nadpisuje kopię w archiwum.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+from datetime import datetime
+
+from models import (Note, NOTE_COLUMNS, NOTE_SUMMARY_COLUMNS, NOTE_VALUES, PREVIEW_LENGTH,
+                    note_order, pack_text, prefix_upper_bound)
+
+ARCHIVE = True
+ARCHIVE_AFTER = 180 * 24 * 3600  # sekundy bez zmian, po których notatka trafia do archiwum
+ARCHIVE_INTERVAL = 3600  # co ile sekund sprawdzać, co archiwizować (0 - tylko ręcznie)
+ARCHIVE_BATCH = 1000  # notatek przenoszonych w jednym kroku
+
+_schema_ready = set()  # pliki archiwum z już utworzoną tabelą
+_schema_lock = threading.Lock()
+_archive_stats = {
+    'passes': 0,
+    'archived': 0,
+    'restored': 0,
+    'last_pass_at': None,
+}
+
+
+def archive_path(path):
+    """Plik archiwum dla magazynu roboczego path: notes.json i notes.db mają osobne archiwa,
+    a rozszerzenie inne niż .db nie myli archiwum z notatnikiem
+    """
+    return path + '.archive.sqlite'
+
+
+def is_stale(note, now):
+    """Czy notatka nadaje się do archiwum; notatki bez poprawnego czasu zostają w magazynie roboczym"""
+    modified = note.modified
+    return modified is not None and modified < now - ARCHIVE_AFTER
+
+
+def _init_archive(conn, path):
+    with _schema_lock:
+        if path in _schema_ready:
+            return
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS notes (
+                id INTEGER PRIMARY KEY,
+                title TEXT NOT NULL,
+                content TEXT NOT NULL,
+                color TEXT DEFAULT '#ffffff',
+                timestamp TEXT NOT NULL,
+                content_z BLOB,
+                preview TEXT,
+                modified REAL,
+                title_key TEXT
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_notes_color_modified ON notes (color, modified)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_notes_modified ON notes (modified)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_notes_title ON notes (title COLLATE NOCASE)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_notes_title_key ON notes (title_key, id)')
+        conn.commit()
+        _schema_ready.add(path)
+
+
+@contextmanager
+def archive_connection(path, create=False):
+    """Połączenie z archiwum magazynu path; None, gdy archiwum nie istnieje, a create=False"""
+    target = archive_path(path)
+    if not create and not os.path.exists(target):
+        yield None
+        return
+    with closing(sqlite3.connect(target)) as conn:
+        _init_archive(conn, target)
+        yield conn
+
+
+def cold_note(note):
+    """Notatka w postaci do archiwum - każda treść dłuższa niż podgląd jest spakowana"""
+    content = note.get_content() or ''
+    if len(content) <= PREVIEW_LENGTH:
+        return Note(note.id, note.title, content, note.color, note.timestamp)
+    return Note(note.id, note.title, '', note.color, note.timestamp, pack_text(content), content[:PREVIEW_LENGTH])
+
+
+def hot_note(note):
+    """Notatka z archiwum w postaci magazynu roboczego (próg kompresji jak przy zapisie)"""
+    return Note.create(note.id, note.title, note.get_content(), note.color, note.timestamp)
+
+
+def store_archived(path, notes):
+    """Zapisuje notatki w archiwum (nadpisując wcześniejsze kopie); zwraca ich liczbę"""
+    if not notes:
+        return 0
+    with archive_connection(path, create=True) as conn:
+        conn.executemany(f'INSERT OR REPLACE INTO notes ({NOTE_COLUMNS}) VALUES ({NOTE_VALUES})',
+                         [cold_note(note).to_row() for note in notes])
+        conn.commit()
+    return len(notes)
+
+
+def remove_archived(path, note_ids):
+    """Usuwa notatki z archiwum; zwraca liczbę usuniętych"""
+    note_ids = list(note_ids)
+    if not note_ids:
+        return 0
+    with archive_connection(path) as conn:
+        if conn is None:
+            return 0
+        removed = conn.executemany('DELETE FROM notes WHERE id = ?', [(note_id,) for note_id in note_ids]).rowcount
+        conn.commit()
+    return removed
+
+
+def get_archived(path, note_id):
+    """Notatka z archiwum albo None"""
+    with archive_connection(path) as conn:
+        if conn is None:
+            return None
+        row = conn.execute(f'SELECT {NOTE_COLUMNS} FROM notes WHERE id = ?', (note_id,)).fetchone()
+    return Note.from_row(row) if row is not None else None
+
+
+def list_archived(path, color=None, after=None, before=None, sort=None):
+    """Notatki archiwum do listy (bez treści spakowanej), z tymi samymi filtrami co lista główna"""
+    conditions = []
+    params = []
+    if color is not None:
+        conditions.append('color = ?')
+        params.append(color)
+    if after is not None:
+        conditions.append('modified > ?')
+        params.append(after)
+    if before is not None:
+        conditions.append('modified < ?')
+        params.append(before)
+    where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+
+    with archive_connection(path) as conn:
+        if conn is None:
+            return []
+        rows = conn.execute(
+            f'SELECT {NOTE_SUMMARY_COLUMNS} FROM notes{where} ORDER BY {note_order(sort, after, before)}', params
+        ).fetchall()
+    return [Note.from_row(row) for row in rows]
+
+
+def suggest_archived(path, prefix, limit):
+    """Podpowiedzi z archiwum: lista (title_key, id, tytuł, kolor) rosnąco po title_key"""
+    with archive_connection(path) as conn:
+        if conn is None:
+            return []
+        return conn.execute(
+            'SELECT title_key, id, title, color FROM notes WHERE title_key >= ? AND title_key < ? '
+            'ORDER BY title_key, id LIMIT ?',
+            (prefix, prefix_upper_bound(prefix), limit)
+        ).fetchall()
+
+
+def iter_archived(path):
+    """Wszystkie notatki archiwum po kolei (eksport, kopia dla repliki)"""
+    with archive_connection(path) as conn:
+        if conn is None:
+            return
+        for row in conn.execute(f'SELECT {NOTE_COLUMNS} FROM notes ORDER BY id'):
+            yield Note.from_row(row)
+
+
+def max_archived_id(path):
+    with archive_connection(path) as conn:
+        if conn is None:
+            return 0
+        return conn.execute('SELECT COALESCE(MAX(id), 0) FROM notes').fetchone()[0]
+
+
+def count_archived(path):
+    with archive_connection(path) as conn:
+        if conn is None:
+            return 0
+        return conn.execute('SELECT COUNT(*) FROM notes').fetchone()[0]
+
+
+def record_archive_pass(archived):
+    _archive_stats['passes'] += 1
+    _archive_stats['archived'] += archived
+    _archive_stats['last_pass_at'] = datetime.now().isoformat()
+
+
+def record_restore():
+    _archive_stats['restored'] += 1
+
+
+def archive_stats(path=None):
+    """Metryki archiwizacji; z path - także liczba notatek w archiwum tego magazynu"""
+    stats = {'enabled': ARCHIVE, 'archive_after_days': ARCHIVE_AFTER / 86400, **_archive_stats}
+    if path is not None:
+        stats['notes'] = count_archived(path)
+    return stats
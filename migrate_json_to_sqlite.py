@@ -0,0 +1,293 @@
+"""Migracja notes.json (app.py) do notes.db (app_sqlite.py).
+
+Plik JSON jest czytany strumieniowo, więc nawet wielogigabajtowy notes.json
+nie musi mieścić się w pamięci. Notatki trafiają do tabeli notes partiami,
+każda w jednej transakcji razem z zapisem postępu - przerwaną migrację
+wystarczy uruchomić ponownie, a zacznie od miejsca, w którym skończyła.
+Na końcu liczba wierszy i suma kontrolna są porównywane ze źródłem.
+Archiwum notes.json (notes.json.archive.sqlite) trafia do archiwum bazy
+(notes.db.archive.sqlite) i jest weryfikowane tak samo.
+
+Jeśli obok źródła jest magazyn mmap app.py (notes.idx.json), to on jest
+aktualny (notes.json po konwersji dostaje przyrostek .migrated) - migracja
+czyta wtedy indeks i plik danych notes.<generacja>.dat bezpośrednio, a postęp
+liczy w wierszach indeksu zamiast w bajtach.
+
+Użycie:
+    python migrate_json_to_sqlite.py [--source notes.json] [--database notes.db]
+"""
+import argparse
+import codecs
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import sys
+import time
+
+from app_sqlite import init_db
+from archive import iter_archived, store_archived
+from models import Note, NOTE_COLUMNS, NOTE_VALUES
+
+READ_CHUNK_SIZE = 1 << 20  # bajtów czytanych z pliku naraz
+BATCH_SIZE = 50000  # notatek w jednej transakcji
+CHECKSUM_MODULO = 1 << 64
+
+
+def iter_json_array(f, offset=0):
+    """Zwraca kolejne obiekty tablicy JSON razem z offsetem (w bajtach) za każdym z nich.
+
+    Dla offset > 0 zakłada, że plik jest ustawiony tuż za wcześniej
+    przetworzonym elementem tablicy.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    f.seek(offset)
+
+    buffer = ''
+    pos = 0
+    position = offset  # offset w bajtach odpowiadający buffer[pos]
+    started = offset > 0
+    eof = False
+
+    while True:
+        # Pomiń białe znaki, przecinki i początek tablicy (same znaki ASCII)
+        skipped_from = pos
+        while pos < len(buffer) and (buffer[pos] in ' \t\r\n,' or (buffer[pos] == '[' and not started)):
+            started = started or buffer[pos] == '['
+            pos += 1
+        position += pos - skipped_from
+
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+
+        if pos < len(buffer):
+            try:
+                obj, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                position += len(buffer[pos:end].encode('utf-8'))
+                pos = end
+                yield obj, position
+                continue
+
+        if eof:
+            return
+
+        # Dopiero przy doczytywaniu bufor jest przycinany do nieprzetworzonej części
+        chunk = f.read(READ_CHUNK_SIZE)
+        eof = not chunk
+        buffer = buffer[pos:] + utf8.decode(chunk, final=eof)
+        pos = 0
+
+
+def note_checksum(note_id, title, content, color, timestamp):
+    """Suma kontrolna notatki - niezależna od formatu zapisu treści"""
+    digest = hashlib.sha256(
+        json.dumps([note_id, title, content, color, timestamp], ensure_ascii=False).encode('utf-8')
+    ).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def source_checksum(note):
+    return note_checksum(note.id, note.title, note.get_content() or '', note.color, note.timestamp)
+
+
+def database_checksum(conn):
+    """Liczba wierszy i suma kontrolna (niezależna od kolejności) tabeli notes"""
+    count = 0
+    checksum = 0
+    for row in conn.execute(f'SELECT {NOTE_COLUMNS} FROM notes'):
+        note = Note.from_row(row)
+        checksum = (checksum + note_checksum(note.id, note.title, note.get_content(), note.color,
+                                             note.timestamp)) % CHECKSUM_MODULO
+        count += 1
+    return count, checksum
+
+
+def archive_checksum(path):
+    """Liczba notatek i suma kontrolna archiwum magazynu path"""
+    count = 0
+    checksum = 0
+    for note in iter_archived(path):
+        checksum = (checksum + source_checksum(note)) % CHECKSUM_MODULO
+        count += 1
+    return count, checksum
+
+
+def migrate_archive(source, database, batch_size=BATCH_SIZE):
+    """Przenosi archiwum źródła do archiwum bazy (INSERT OR REPLACE - można powtarzać); zwraca liczbę notatek"""
+    migrated = 0
+    batch = []
+    for note in iter_archived(source):
+        batch.append(note)
+        migrated += 1
+        if len(batch) >= batch_size:
+            store_archived(database, batch)
+            batch.clear()
+    store_archived(database, batch)
+    return migrated
+
+
+def init_migration_state(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS migration_state (
+            source TEXT PRIMARY KEY,
+            offset INTEGER NOT NULL,
+            migrated INTEGER NOT NULL,
+            checksum TEXT NOT NULL,
+            finished INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.commit()
+
+
+def store_index_path(source):
+    """Indeks magazynu mmap app.py dla danego notes.json (jak NOTES_INDEX_FILE w app.py)"""
+    return os.path.splitext(source)[0] + '.idx.json'
+
+
+def store_data_path(source, generation):
+    """Plik danych magazynu mmap danej generacji (jak data_path w app.py)"""
+    return f'{os.path.splitext(source)[0]}.{generation}.dat'
+
+
+def iter_json_notes(source, offset=0):
+    """Notatki z notes.json razem z offsetem (w bajtach) za każdą z nich"""
+    with open(source, 'rb') as f:
+        for data, position in iter_json_array(f, offset):
+            yield Note.from_json(data), position
+
+
+def iter_store_notes(source, offset=0):
+    """Notatki z magazynu mmap razem z numerem wiersza indeksu za każdą z nich (jak load_store w app.py)"""
+    with open(store_index_path(source), 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    path = store_data_path(source, index['generation'])
+
+    data_map = None
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path, 'rb') as f:
+            data_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        rows = index['notes']
+        for position in range(offset, len(rows)):
+            note_id, title, color, timestamp, head, data_offset, length = rows[position]
+            if data_offset < 0:
+                # Krótka treść w całości w indeksie
+                note = Note(note_id, title, head, color, timestamp)
+            else:
+                note = Note(note_id, title, '', color, timestamp,
+                            data_map[data_offset:data_offset + length], head)
+            yield note, position + 1
+    finally:
+        if data_map is not None:
+            data_map.close()
+
+
+def migrate(source, database, batch_size=BATCH_SIZE):
+    """Migruje notatki; zwraca True, jeśli weryfikacja się powiodła"""
+    if os.path.exists(store_index_path(source)):
+        # Postęp w wierszach indeksu - zapisywany pod nazwą indeksu, żeby nie mylić go z bajtami notes.json
+        state_key, iter_notes, unit = store_index_path(source), iter_store_notes, 'wiersza indeksu'
+    else:
+        state_key, iter_notes, unit = source, iter_json_notes, 'bajtu'
+    print(f"📂 Źródło: {state_key}")
+
+    init_db(database)
+    conn = sqlite3.connect(database)
+    conn.execute('PRAGMA synchronous = NORMAL')
+    init_migration_state(conn)
+
+    state = conn.execute(
+        'SELECT offset, migrated, checksum, finished FROM migration_state WHERE source = ?', (state_key,)
+    ).fetchone()
+
+    if state is None:
+        existing = conn.execute('SELECT COUNT(*) FROM notes').fetchone()[0]
+        if existing:
+            print(f"❌ Baza {database} zawiera już {existing} notatek - migracja wymaga pustej bazy")
+            conn.close()
+            return False
+        offset, migrated, checksum, finished = 0, 0, 0, 0
+    else:
+        offset, migrated, checksum, finished = state[0], state[1], int(state[2]), state[3]
+        if not finished:
+            print(f"↪️ Wznawianie migracji od {unit} {offset} ({migrated} notatek już przeniesionych)")
+
+    started = time.monotonic()
+    if not finished:
+        batch = []
+
+        def commit_batch(position):
+            conn.executemany(f'INSERT OR REPLACE INTO notes ({NOTE_COLUMNS}) VALUES ({NOTE_VALUES})', batch)
+            # Postęp zapisany w tej samej transakcji co notatki
+            conn.execute(
+                'INSERT OR REPLACE INTO migration_state (source, offset, migrated, checksum, finished) '
+                'VALUES (?, ?, ?, ?, 0)',
+                (state_key, position, migrated, str(checksum))
+            )
+            conn.commit()
+            batch.clear()
+            print(f"   … {migrated} notatek")
+
+        position = offset
+        for note, position in iter_notes(source, offset):
+            batch.append(note.to_row())
+            migrated += 1
+            checksum = (checksum + source_checksum(note)) % CHECKSUM_MODULO
+            if len(batch) >= batch_size:
+                commit_batch(position)
+        if batch:
+            commit_batch(position)
+
+        conn.execute(
+            'INSERT OR REPLACE INTO migration_state (source, offset, migrated, checksum, finished) '
+            'VALUES (?, ?, ?, ?, 1)',
+            (state_key, position, migrated, str(checksum))
+        )
+        conn.commit()
+        print(f"✅ Przeniesiono {migrated} notatek w {time.monotonic() - started:.1f} s")
+
+    archived = migrate_archive(source, database, batch_size)
+    if archived:
+        print(f"✅ Przeniesiono {archived} notatek z archiwum")
+
+    # Weryfikacja: liczba wierszy i suma kontrolna - osobno notatki i archiwum
+    count, db_checksum = database_checksum(conn)
+    conn.close()
+    source_archive = archive_checksum(source)
+    target_archive = archive_checksum(database)
+
+    if count != migrated or db_checksum != checksum:
+        print(f"❌ Weryfikacja nieudana: źródło {migrated} notatek, baza {count} "
+              f"(suma kontrolna {'zgodna' if db_checksum == checksum else 'niezgodna'})")
+        return False
+    if source_archive != target_archive:
+        print(f"❌ Weryfikacja archiwum nieudana: źródło {source_archive[0]} notatek, baza {target_archive[0]} "
+              f"(suma kontrolna {'zgodna' if source_archive[1] == target_archive[1] else 'niezgodna'})")
+        return False
+
+    print(f"✅ Weryfikacja poprawna: {count} notatek, suma kontrolna {checksum:016x}")
+    if source_archive[0]:
+        print(f"✅ Archiwum: {source_archive[0]} notatek, suma kontrolna {source_archive[1]:016x}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migracja notes.json do bazy SQLite')
+    parser.add_argument('--source', default='notes.json', help='plik JSON z notatkami (app.py)')
+    parser.add_argument('--database', default='notes.db', help='docelowa baza SQLite (app_sqlite.py)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='notatek w jednej transakcji')
+    args = parser.parse_args()
+
+    print("🚚 MIGRACJA notes.json → SQLite")
+    ok = migrate(args.source, args.database, args.batch_size)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
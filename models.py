@@ -0,0 +1,389 @@
+"""Wspólny model notatki dla app.py i app_sqlite.py.
+
+Note trzyma pola w __slots__ (bez __dict__ na każdą notatkę), a dużą treść
+skompresowaną jako bajty razem z krótkim podglądem. Konwersje:
+- from_json / to_json - format notes.json i dziennika replikacji
+  (duża treść jako content_z w base64),
+- from_row / to_row - wiersz tabeli notes (kolumny NOTE_COLUMNS),
+- summary / full - odpowiedzi API (lista z podglądem / pełna treść).
+
+Revision to jedna zapisana wersja notatki w historii: pełna treść (keyframe)
+albo różnica względem poprzedniej wersji (delta).
+"""
+import base64
+import json
+import sys
+import unicodedata
+import zlib
+from datetime import datetime, timezone
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Treść dłuższa niż próg jest trzymana skompresowana, a lista notatek
+# pokazuje wtedy tylko zapisany podgląd
+COMPRESS_THRESHOLD = 4096
+PREVIEW_LENGTH = 100
+
+# Kolejność kolumn zgodna z Note.from_row / Note.to_row; modified - czas
+# modyfikacji jako liczba (pochodna timestamp, pod indeksy i sortowanie),
+# title_key - tytuł w postaci suggest_key (pod podpowiedzi tytułów)
+NOTE_COLUMNS = 'id, title, content, color, timestamp, content_z, preview, modified, title_key'
+NOTE_VALUES = '?, ?, ?, ?, ?, ?, ?, ?, ?'
+# Do list - bez czytania skompresowanej treści
+NOTE_SUMMARY_COLUMNS = 'id, title, content, color, timestamp, NULL AS content_z, preview'
+
+# Sortowania listy: modified i created - od najnowszych, title - alfabetycznie
+NOTE_SORTS = ('modified', 'created', 'title')
+# Kolejność listy w SQL dla ?sort= (None - domyślna); każda pokryta indeksem tabeli notes
+NOTE_ORDER = {
+    None: 'id DESC',
+    'modified': 'modified DESC, id DESC',
+    'created': 'id DESC',
+    'title': 'title COLLATE NOCASE, id',
+}
+# To samo przy filtrze czasu: unarny + wyłącza indeks przy ORDER BY, więc SQLite wybiera
+# zakres z idx_notes_modified / idx_notes_color_modified i sortuje tylko wybrane wiersze,
+# zamiast przeglądać całą tabelę w kolejności id albo tytułu
+NOTE_ORDER_RANGE = {
+    None: '+id DESC',
+    'modified': 'modified DESC, id DESC',
+    'created': '+id DESC',
+    'title': '+title COLLATE NOCASE, +id',
+}
+
+
+def note_order(sort, after=None, before=None):
+    """ORDER BY listy notatek dla ?sort= i filtrów czasu"""
+    if after is None and before is None:
+        return NOTE_ORDER[sort]
+    return NOTE_ORDER_RANGE[sort]
+
+# Podpowiedzi tytułów (/api/notes/suggest): domyślna i największa liczba wyników
+SUGGEST_LIMIT = 10
+SUGGEST_MAX_LIMIT = 50
+
+# Historia wersji: co która wersja zapisywana w całości (keyframe) - odtworzenie
+# dowolnej wersji to keyframe + najwyżej REVISION_KEYFRAME_INTERVAL - 1 delt
+REVISION_KEYFRAME_INTERVAL = 20
+REVISION_COMPRESS_MIN = 256  # krótsze dane wersji zapisywane bez kompresji
+# Kolejność kolumn zgodna z Revision.from_row / Revision.to_row
+REVISION_COLUMNS = 'rev, created, title, color, timestamp, keyframe, data'
+
+
+def timestamp_key(timestamp):
+    """Czas ISO 8601 jako liczba sekund; None dla pustego lub błędnego.
+
+    Czas bez strefy liczony jest jak UTC - klucz nie zależy od strefy serwera,
+    a kolejność i tak wynika z samego zapisu czasu.
+    """
+    try:
+        moment = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def parse_list_query(args):
+    """Filtry i sortowanie listy z parametrów zapytania: (color, after, before, sort).
+
+    after/before to granice czasu modyfikacji (timestamp_key, bez końców);
+    ValueError przy błędnej wartości.
+    """
+    sort = args.get('sort') or None
+    if sort is not None and sort not in NOTE_SORTS:
+        raise ValueError(f"nieznane sortowanie '{sort}' (dostępne: {', '.join(NOTE_SORTS)})")
+
+    bounds = []
+    for name in ('modified_after', 'modified_before'):
+        value = args.get(name)
+        key = timestamp_key(value) if value else None
+        if value and key is None:
+            raise ValueError(f"{name} musi być czasem ISO 8601, np. 2024-01-31T12:00:00")
+        bounds.append(key)
+
+    return args.get('color') or None, bounds[0], bounds[1], sort
+
+
+def text_value(value):
+    """Tytuł lub treść z JSON jako tekst: liczby, listy itp. - ich zapis JSON (None zostaje None)"""
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def suggest_key(text):
+    """Tekst do porównań bez wielkości liter i znaków diakrytycznych: 'Źródło Łąki' -> 'zrodlo laki'
+
+    ł nie rozkłada się w Unicode na l + znak łączący, więc jest zamieniane wprost. Tytuł spoza
+    napisów (zapisany przed text_value) liczy się w postaci JSON.
+    """
+    decomposed = unicodedata.normalize('NFKD', (text_value(text) or '').casefold().replace('ł', 'l'))
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def parse_suggest_query(args):
+    """Parametry podpowiedzi z zapytania: (prefiks jako suggest_key, limit); ValueError przy błędnym limicie"""
+    try:
+        limit = int(args.get('limit', SUGGEST_LIMIT))
+    except ValueError:
+        raise ValueError('limit musi być liczbą całkowitą')
+    if not 1 <= limit <= SUGGEST_MAX_LIMIT:
+        raise ValueError(f'limit musi być między 1 a {SUGGEST_MAX_LIMIT}')
+    return suggest_key(args.get('prefix', '')), limit
+
+
+def prefix_upper_bound(prefix):
+    """Najmniejszy napis większy od wszystkich zaczynających się od prefix (prefix niepusty)"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def compress_content(content):
+    """Kompresuje treść (zstd, jeśli dostępne, w przeciwnym razie zlib)"""
+    raw = content.encode('utf-8')
+    if zstandard is not None:
+        return b'zstd:' + zstandard.ZstdCompressor().compress(raw)
+    return b'zlib:' + zlib.compress(raw, 6)
+
+
+def pack_text(text):
+    """Tekst jako bajty - kompresowany dopiero powyżej REVISION_COMPRESS_MIN"""
+    if len(text) < REVISION_COMPRESS_MIN:
+        return b'raw:' + text.encode('utf-8')
+    return compress_content(text)
+
+
+def decompress_content(blob):
+    codec, _, payload = bytes(blob).partition(b':')
+    if codec == b'raw':
+        return payload.decode('utf-8')
+    if codec == b'zstd':
+        return zstandard.ZstdDecompressor().decompress(payload).decode('utf-8')
+    return zlib.decompress(payload).decode('utf-8')
+
+
+def _common_prefix_length(a, b):
+    # Bisekcja na porównaniach wycinków (w C) zamiast pętli po znakach
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a.startswith(b[:middle]):
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _common_suffix_length(a, b, limit):
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a.endswith(b[len(b) - middle:]):
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def make_delta(old, new):
+    """Różnica jako [długość wspólnego początku, długość wspólnego końca, nowy środek].
+
+    Autozapis zmienia zwykle jedno miejsce notatki, więc delta to kilka znaków.
+    """
+    prefix = _common_prefix_length(old, new)
+    suffix = _common_suffix_length(old, new, min(len(old), len(new)) - prefix)
+    return [prefix, suffix, new[prefix:len(new) - suffix]]
+
+
+def apply_delta(old, delta):
+    prefix, suffix, middle = delta
+    return old[:prefix] + middle + old[len(old) - suffix:]
+
+
+def revision_chain(revisions, rev):
+    """Wersje potrzebne do odtworzenia rev: od najbliższego wcześniejszego keyframe do rev
+
+    revisions - wersje jednej notatki rosnąco po rev; None, jeśli rev nie istnieje
+    """
+    end = next((index for index, revision in enumerate(revisions) if revision.rev == rev), None)
+    if end is None:
+        return None
+    start = end
+    while not revisions[start].keyframe:
+        start -= 1
+    return revisions[start:end + 1]
+
+
+def revision_content(chain):
+    """Treść ostatniej wersji łańcucha zaczynającego się od keyframe"""
+    content = None
+    for revision in chain:
+        content = revision.apply(content)
+    return content
+
+
+class Revision:
+    """Zapisana wersja notatki; data - pełna treść (keyframe) albo delta względem poprzedniej wersji"""
+    __slots__ = ('rev', 'created', 'title', 'color', 'timestamp', 'keyframe', 'data')
+
+    def __init__(self, rev, created, title, color, timestamp, keyframe, data):
+        self.rev = rev
+        self.created = created
+        self.title = title
+        self.color = sys.intern(color) if isinstance(color, str) else color
+        self.timestamp = timestamp
+        self.keyframe = bool(keyframe)
+        self.data = data
+
+    @classmethod
+    def capture(cls, rev, note, created, content, base=None):
+        """Wersja ze stanu notatki; base - treść poprzedniej wersji (delta) albo None (keyframe)"""
+        if base is None:
+            data = pack_text(content)
+        else:
+            data = pack_text(json.dumps(make_delta(base, content), ensure_ascii=False))
+        return cls(rev, created, note.title, note.color, note.timestamp, base is None, data)
+
+    def apply(self, base):
+        """Treść tej wersji na podstawie treści poprzedniej (dla keyframe - bez niej)"""
+        text = decompress_content(self.data)
+        if self.keyframe:
+            return text
+        return apply_delta(base, json.loads(text))
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row[0], row[1], row[2], row[3], row[4], row[5], row[6])
+
+    def to_row(self):
+        return (self.rev, self.created, self.title, self.color, self.timestamp, int(self.keyframe), self.data)
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data['rev'], data['created'], data['title'], data['color'], data['timestamp'],
+                   data['keyframe'], base64.b64decode(data['data']))
+
+    def to_json(self):
+        return {'rev': self.rev, 'created': self.created, 'title': self.title, 'color': self.color,
+                'timestamp': self.timestamp, 'keyframe': self.keyframe,
+                'data': base64.b64encode(self.data).decode('ascii')}
+
+    def summary(self):
+        """Wersja do listy historii (bez treści)"""
+        return {'rev': self.rev, 'created': self.created, 'title': self.title, 'color': self.color,
+                'timestamp': self.timestamp, 'keyframe': self.keyframe, 'stored_bytes': len(self.data)}
+
+    def full(self, content):
+        return {'rev': self.rev, 'created': self.created, 'title': self.title, 'color': self.color,
+                'timestamp': self.timestamp, 'content': content}
+
+
+class Note:
+    """Notatka; niezmienna po zapisaniu w magazynie - zmiany przez replace()"""
+    __slots__ = ('id', 'title', 'content', 'color', 'timestamp', 'content_z', 'preview')
+
+    def __init__(self, note_id, title, content='', color='#ffffff', timestamp='', content_z=None, preview=None):
+        self.id = note_id
+        self.title = title
+        self.content = content
+        # Kolorów jest niewiele - jedna kopia napisu na wszystkie notatki
+        self.color = sys.intern(color) if isinstance(color, str) else color
+        self.timestamp = timestamp
+        self.content_z = content_z
+        self.preview = preview
+
+    @classmethod
+    def create(cls, note_id, title, content, color, timestamp):
+        """Nowa notatka z treścią skompresowaną, jeśli przekracza próg"""
+        note = cls(note_id, text_value(title), None, color, timestamp)
+        note.set_content(content)
+        return note
+
+    def set_content(self, content):
+        content = text_value(content)
+        if content is not None and len(content) > COMPRESS_THRESHOLD:
+            self.content = ''
+            self.content_z = compress_content(content)
+            self.preview = content[:PREVIEW_LENGTH]
+        else:
+            self.content = content
+            self.content_z = None
+            self.preview = None
+
+    def get_content(self):
+        """Pełna treść (rozpakowywana tylko dla dużych notatek)"""
+        if self.content_z is not None:
+            return decompress_content(self.content_z)
+        return self.content
+
+    def replace(self, **changes):
+        """Kopia notatki ze zmienionymi polami (treść przez 'content')"""
+        note = Note(self.id, self.title, self.content, self.color, self.timestamp, self.content_z, self.preview)
+        for field, value in changes.items():
+            if field == 'content':
+                note.set_content(value)
+            elif field == 'title':
+                note.title = text_value(value)
+            else:
+                setattr(note, field, value)
+        return note
+
+    @classmethod
+    def from_json(cls, data):
+        if 'content_z' in data:
+            return cls(data['id'], data.get('title', 'Nowa notatka'), '', data.get('color', '#ffffff'),
+                       data.get('timestamp', ''), base64.b64decode(data['content_z']), data.get('preview', ''))
+        return cls.create(data['id'], data.get('title', 'Nowa notatka'), data.get('content', ''),
+                          data.get('color', '#ffffff'), data.get('timestamp', ''))
+
+    def to_json(self):
+        if self.content_z is None:
+            return {'id': self.id, 'title': self.title, 'content': self.content,
+                    'timestamp': self.timestamp, 'color': self.color}
+        return {'id': self.id, 'title': self.title, 'timestamp': self.timestamp, 'color': self.color,
+                'content_z': base64.b64encode(bytes(self.content_z)).decode('ascii'), 'preview': self.preview}
+
+    @property
+    def modified(self):
+        return timestamp_key(self.timestamp)
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row[0], row[1], row[2], row[3], row[4], row[5], row[6])
+
+    def to_row(self):
+        return (self.id, self.title, self.content, self.color, self.timestamp, self.content_z, self.preview,
+                self.modified, suggest_key(self.title))
+
+    def summary(self):
+        """Notatka do listy - skompresowana treść nie jest rozpakowywana"""
+        if self.preview is None:
+            return {'id': self.id, 'title': self.title, 'content': self.content,
+                    'color': self.color, 'timestamp': self.timestamp}
+        return {'id': self.id, 'title': self.title, 'preview': self.preview, 'truncated': True,
+                'color': self.color, 'timestamp': self.timestamp}
+
+    def full(self, content=None):
+        """Notatka z pełną treścią (rozpakowaną, o ile nie podano jej wprost)"""
+        return {'id': self.id, 'title': self.title,
+                'content': self.get_content() if content is None else content,
+                'color': self.color, 'timestamp': self.timestamp}
+
+
+def read_ndjson(stream):
+    """Czyta strumień NDJSON linia po linii (ValueError z numerem błędnej linii)"""
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f'linia {line_no}: {e}')
+        if not isinstance(data, dict):
+            raise ValueError(f'linia {line_no}: oczekiwano obiektu JSON')
+        yield data
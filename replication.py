@@ -0,0 +1,62 @@
+"""Replikacja wspólna dla app.py i app_sqlite.py.
+
+Każda zmiana notatki trafia do dziennika primary. Instancja z
+KEEP_REPLICA_OF=<adres primary> jest repliką tylko do odczytu, która czyta
+dziennik przez HTTP (/api/replication/changes, /api/replication/snapshot)
+i stosuje zmiany u siebie. Sam dziennik i stosowanie zmian są w aplikacjach -
+każdy backend przechowuje notatki inaczej.
+
+Dziennik to pełny zrzut notatek, więc primary udostępnia go tylko replikom
+z adresów KEEP_REPLICATION_FOLLOWERS albo z tym samym KEEP_ADMIN_TOKEN
+(replika wysyła go w X-Admin-Token).
+"""
+import os
+import time
+import urllib.request
+
+from flask import jsonify, request
+
+from admission import ADMIN_TOKEN, replication_denied
+
+REPLICA_OF = os.environ.get('KEEP_REPLICA_OF')
+CHANGELOG_KEEP = 100000  # ile ostatnich zmian trzymać w dzienniku
+REPLICATION_POLL_INTERVAL = 0.5  # sekundy między odpytaniami primary
+REPLICATION_BATCH = 1000  # zmian w jednej odpowiedzi
+REPLICATION_TIMEOUT = 10
+
+
+def fetch_from_primary(path):
+    headers = {'X-Admin-Token': ADMIN_TOKEN} if ADMIN_TOKEN else {}
+    return urllib.request.urlopen(urllib.request.Request(REPLICA_OF.rstrip('/') + path, headers=headers),
+                                  timeout=REPLICATION_TIMEOUT)
+
+
+def reject_writes_on_replica():
+    """before_request: replika przyjmuje tylko odczyty notatek i nie udostępnia dziennika zmian;
+    dziennik primary tylko dla uprawnionych replik
+    """
+    if REPLICA_OF and request.method in ('POST', 'PUT', 'DELETE') and (
+            request.path.startswith('/api/notes') or request.path == '/api/import'):
+        return jsonify({'error': 'Replika tylko do odczytu - zapisy kieruj do primary'}), 403
+    if REPLICA_OF and request.path in ('/api/replication/changes', '/api/replication/snapshot'):
+        # Replika nie prowadzi własnego dziennika, więc nie może być źródłem dla innych
+        return jsonify({'error': 'Replika nie może być źródłem replikacji'}), 409
+    if request.path in ('/api/replication/changes', '/api/replication/snapshot'):
+        return replication_denied()
+    return None
+
+
+def replication_stats(stats):
+    """Stan replikacji ze statystyk pętli repliki stats; lag_seconds - ile czasu minęło od chwili,
+    gdy replika była w pełni aktualna
+    """
+    if not REPLICA_OF:
+        return {'role': 'primary'}
+    caught_up_at = stats['caught_up_at']
+    return {
+        'role': 'replica',
+        'primary': REPLICA_OF,
+        'lag_changes': max(0, stats['primary_seq'] - stats['applied_seq']),
+        'lag_seconds': time.time() - caught_up_at if caught_up_at else None,
+        **stats,
+    }
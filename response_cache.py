@@ -0,0 +1,138 @@
+"""Cache gotowych odpowiedzi listy notatek, wspólny dla app.py i app_sqlite.py.
+
+Lista notatek jest odpytywana przez klienta co kilka sekund, a zmienia się
+rzadko. Każdy wariant listy (zakres danych + parametry zapytania) trzymany jest
+jako gotowe bajty JSON, a dla klientów z Accept-Encoding: gzip - także
+skompresowany. Unieważnianie przez numery generacji: zapis zmienia generację
+zakresu (plik notatek / baza notatnika), więc starsze wpisy przestają pasować;
+wpisy usuwa też LRU przy przekroczeniu limitu liczby lub rozmiaru.
+
+Generacja musi być odczytana przed zbudowaniem odpowiedzi, a zmieniona po
+zatwierdzeniu zapisu - wtedy wpis zbudowany ze starych danych nigdy nie
+dostaje nowej generacji. Cache widzi tylko zapisy wykonane przez ten proces.
+"""
+import gzip
+import itertools
+import threading
+import uuid
+from collections import OrderedDict
+
+from flask import Response, current_app, request
+
+LIST_CACHE = True
+LIST_CACHE_ENTRIES = 64  # ile wariantów listy pamiętać
+LIST_CACHE_MAX_BYTES = 64 * 1024 * 1024  # łączny rozmiar (JSON + gzip)
+GZIP_MIN_SIZE = 1024  # mniejszych odpowiedzi nie opłaca się kompresować
+GZIP_LEVEL = 6
+
+_instance = uuid.uuid4().hex[:8]  # ETag z poprzedniego uruchomienia serwera nie pasuje
+_generation_counter = itertools.count(1)  # generacje unikalne między zakresami - ETag ich nie pomyli
+_generations = {}  # zakres -> bieżąca generacja
+_entries = OrderedDict()  # (zakres, wariant) -> CachedList
+_cache_lock = threading.Lock()
+_cache_bytes = 0
+_cache_stats = {
+    'hits': 0,
+    'misses': 0,
+    'not_modified': 0,
+    'evictions': 0,
+    'invalidations': 0,
+}
+
+
+class CachedList:
+    __slots__ = ('generation', 'body', 'body_gzip')
+
+    def __init__(self, generation, body):
+        self.generation = generation
+        self.body = body
+        self.body_gzip = None
+
+    def size(self):
+        return len(self.body) + len(self.body_gzip or b'')
+
+
+def current_generation(scope):
+    with _cache_lock:
+        generation = _generations.get(scope)
+        if generation is None:
+            generation = _generations[scope] = next(_generation_counter)
+        return generation
+
+
+def invalidate_lists(scope):
+    """Unieważnia listy zakresu - wywoływać po zatwierdzeniu zapisu"""
+    global _cache_bytes
+    with _cache_lock:
+        _generations[scope] = next(_generation_counter)
+        _cache_stats['invalidations'] += 1
+        for key in [key for key in _entries if key[0] == scope]:
+            _cache_bytes -= _entries.pop(key).size()
+
+
+def _store(key, entry):
+    global _cache_bytes
+    with _cache_lock:
+        previous = _entries.pop(key, None)
+        if previous is not None:
+            _cache_bytes -= previous.size()
+        # Wpis zbudowany dla generacji, która już się zmieniła, nie trafia do cache
+        if _generations.get(key[0]) != entry.generation:
+            return
+        _entries[key] = entry
+        _cache_bytes += entry.size()
+        while len(_entries) > LIST_CACHE_ENTRIES or _cache_bytes > LIST_CACHE_MAX_BYTES:
+            _, evicted = _entries.popitem(last=False)
+            _cache_bytes -= evicted.size()
+            _cache_stats['evictions'] += 1
+
+
+def cached_list_response(scope, variant, build):
+    """Odpowiedź JSON z cache; build() tworzy dane listy, gdy wpisu brak lub jest nieaktualny"""
+    if not LIST_CACHE:
+        return current_app.json.response(build())
+
+    generation = current_generation(scope)
+    etag = f'{_instance}-{generation}'
+    headers = {'ETag': f'"{etag}"', 'Vary': 'Accept-Encoding, X-Notebook', 'Cache-Control': 'no-cache'}
+    if etag in request.if_none_match:
+        _cache_stats['not_modified'] += 1
+        return Response(status=304, headers=headers)
+
+    key = (scope, variant)
+    with _cache_lock:
+        entry = _entries.get(key)
+        if entry is not None and entry.generation == generation:
+            _entries.move_to_end(key)
+        else:
+            entry = None
+
+    if entry is None:
+        _cache_stats['misses'] += 1
+        # Te same bajty, które zwróciłby jsonify()
+        entry = CachedList(generation, current_app.json.response(build()).get_data())
+        _store(key, entry)
+    else:
+        _cache_stats['hits'] += 1
+
+    if len(entry.body) >= GZIP_MIN_SIZE and 'gzip' in request.accept_encodings:
+        if entry.body_gzip is None:
+            # Nowy wpis zamiast zmiany w miejscu - rozmiar starego zgadza się z licznikiem
+            compressed = CachedList(entry.generation, entry.body)
+            compressed.body_gzip = gzip.compress(entry.body, GZIP_LEVEL)
+            entry = compressed
+            _store(key, entry)
+        headers['Content-Encoding'] = 'gzip'
+        return Response(entry.body_gzip, mimetype='application/json', headers=headers)
+
+    return Response(entry.body, mimetype='application/json', headers=headers)
+
+
+def cache_stats():
+    with _cache_lock:
+        return {
+            'enabled': LIST_CACHE,
+            'entries': len(_entries),
+            'bytes': _cache_bytes,
+            **_cache_stats,
+        }